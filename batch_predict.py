@@ -0,0 +1,213 @@
+"""
+Headless batch scoring for the trained crop yield model.
+
+Streams (Crop, Crop_Year, Season, State, Annual_Rainfall, Fertilizer, Pesticide) rows from a CSV or
+Parquet file in fixed-size chunks, scores each chunk with one vectorized predict call and appends the
+results to the output file, so memory use is bounded by the chunk size and not by the input size.
+
+Usage:
+    python batch_predict.py input.csv predictions.csv --chunksize 100000
+    python batch_predict.py input.parquet predictions.parquet --workers 8
+    python batch_predict.py input.csv predictions.csv --telemetry stages.prom --profile stacks.txt
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+import pandas as pd
+
+from telemetry import telemetry
+from yield_model import add_model_arguments, load_model, prediction_features, check_columns
+
+# Default number of rows scored per model call
+default_chunksize = 100_000
+
+# Name of the column appended to every output chunk
+prediction_column = 'Predicted_Yield'
+
+# Read as floats whatever the values of a chunk look like, so every chunk has the same column types
+float_columns = {'Annual_Rainfall': float, 'Fertilizer': float, 'Pesticide': float}
+
+
+def file_format(path):
+    """
+    Returns 'csv' or 'parquet' based on the file extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.csv', '.txt'):
+        return 'csv'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    raise ValueError(f"Unsupported file type '{ext}' (expected .csv or .parquet)")
+
+
+def read_chunks(path, chunksize=default_chunksize):
+    """
+    Yields DataFrames of at most chunksize rows from a CSV or Parquet file.
+    """
+    if file_format(path) == 'csv':
+        chunks = pd.read_csv(path, chunksize=chunksize, dtype=float_columns)
+    else:
+        import pyarrow.parquet as pq
+
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize))
+    while True:
+        with telemetry.stage('read_chunk'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class ChunkWriter:
+    """
+    Appends scored chunks to a CSV or Parquet file as they are produced. The Parquet schema is that of
+    the first chunk; later chunks are cast to it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = file_format(path)
+        self._parquet_writer = None
+        self._header_written = False
+
+    def write(self, chunk):
+        if self.format == 'csv':
+            chunk.to_csv(self.path, mode='a' if self._header_written else 'w',
+                         header=not self._header_written, index=False)
+            self._header_written = True
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            elif table.schema != self._parquet_writer.schema:
+                table = table.cast(self._parquet_writer.schema)
+            self._parquet_writer.write_table(table)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def score_chunk(model, chunk):
+    """
+    Returns a copy of chunk with the model prediction appended as the prediction column.
+    """
+    check_columns(chunk.columns)
+    scored = chunk.copy()
+    with telemetry.stage('score_chunk'):
+        scored[prediction_column] = model.predict(chunk[prediction_features])
+    return scored
+
+
+def _score_chunks_parallel(scorer, chunks):
+    """
+    Yields scored copies of chunks, predicted by a parallel_predict.ShardedScorer in input order.
+    """
+    in_flight = deque()
+
+    def feed():
+        for chunk in chunks:
+            check_columns(chunk.columns)
+            in_flight.append(chunk)
+            yield chunk[prediction_features]
+
+    for predictions in scorer.imap(feed()):
+        scored = in_flight.popleft().copy()
+        scored[prediction_column] = predictions
+        yield scored
+
+
+def score_file(model, input_path, output_path, chunksize=default_chunksize, progress=None, scorer=None):
+    """
+    Scores every row of input_path and writes the results to output_path chunk by chunk.
+    If scorer (a parallel_predict.ShardedScorer) is given, chunks are scored across its worker
+    processes instead of with model. progress, if given, is called with the running row count
+    after each chunk. Returns the total number of rows scored.
+    """
+    chunks = read_chunks(input_path, chunksize)
+    if scorer is None:
+        scored_chunks = (score_chunk(model, chunk) for chunk in chunks)
+    else:
+        scored_chunks = _score_chunks_parallel(scorer, chunks)
+
+    total_rows = 0
+    with ChunkWriter(output_path) as writer:
+        for scored in scored_chunks:
+            with telemetry.stage('write_chunk'):
+                writer.write(scored)
+            total_rows += len(scored)
+            telemetry.count('rows_scored', len(scored))
+            if progress is not None:
+                progress(total_rows)
+    return total_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/Parquet file with the crop yield model")
+    parser.add_argument("input", help="input .csv or .parquet file")
+    parser.add_argument("output", help="output .csv or .parquet file")
+    add_model_arguments(parser)
+    parser.add_argument("--chunksize", type=int, default=default_chunksize,
+                        help=f"rows scored per model call (default: {default_chunksize})")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes scoring chunks in parallel (default: 1)")
+    parser.add_argument("--telemetry", nargs="?", const="", metavar="PATH",
+                        help="time the read/score/write stages and print a summary or write them to PATH (.prom or .jsonl)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="sample the stacks while scoring and write them to PATH in collapsed (flame graph) format")
+    args = parser.parse_args(argv)
+
+    if args.chunksize < 1:
+        parser.error("--chunksize must be positive")
+    if args.workers < 1:
+        parser.error("--workers must be positive")
+
+    if args.telemetry is not None:
+        telemetry.enable(path=args.telemetry)
+    scorer = None
+    profiler = None
+    try:
+        model = load_model(args.model, args.backend)
+        if args.workers > 1:
+            from parallel_predict import ShardedScorer
+            scorer = ShardedScorer(args.model, workers=args.workers, model=model, backend=args.backend)
+        if args.profile:
+            profiler = telemetry.start_profiler()
+        start = time.perf_counter()
+        total_rows = score_file(model, args.input, args.output, args.chunksize,
+                                progress=lambda n: print(f"Scored {n} rows...", file=sys.stderr),
+                                scorer=scorer)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if scorer is not None:
+            scorer.close()
+        if profiler is not None:
+            telemetry.stop_profiler()
+
+    elapsed = time.perf_counter() - start
+    rate = total_rows / elapsed if elapsed > 0 else float('inf')
+    print(f"Scored {total_rows} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec) -> {args.output}", file=sys.stderr)
+    if profiler is not None:
+        profiler.write_collapsed(args.profile)
+        print(profiler.report(), file=sys.stderr)
+    telemetry.dump()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
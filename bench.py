@@ -0,0 +1,287 @@
+"""
+Benchmarks for the prediction hot paths of crop.py and dashboard.py.
+
+Inputs are synthetic rows drawn from the crop/season/state option lists with fixed seeds. Each
+benchmark reports one or more metrics, each marked as lower- or higher-is-better:
+
+    model_load   time for a fresh Python process to import what it needs, load the model and make the
+                 first prediction
+    single_row   latency of one-row predictions (crop.py's predict button), p50 and p99, through
+                 model.predict() on a one-row DataFrame and, for a KNN model, through the pandas-free
+                 predict_row() of model_artifact.compile_model()
+    batch        throughput of batched predictions at several batch sizes
+    trend        the dashboard's trend path: trend_horizon rows through a cold prediction cache
+    figure       trend figure rendering: first full draw, full redraw and blitted update
+    sweep        throughput of a cold Fertilizer x Annual_Rainfall x Pesticide sweep (see sweep.py)
+
+Results are printed as a table and written as JSON with --json. Given --baseline (a JSON file from an
+earlier run), the run fails with exit status 1 if any metric is worse than the baseline by more than
+--threshold.
+
+Usage:
+    python bench.py --json bench.json
+    python bench.py --baseline bench.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from yield_model import trend_horizon, trend_rows, synthetic_frame
+
+default_threshold = 0.2
+batch_sizes = (1, 16, 256, 4096)
+# Latency percentiles are taken per round and the best round is reported, which filters out most of
+# the interference from other processes
+rounds = 5
+
+
+def _time_calls(fn, args_list):
+    """
+    Calls fn(*args) for each args of args_list and returns the duration of every call in seconds.
+    """
+    durations = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        durations.append(time.perf_counter() - start)
+    return np.array(durations)
+
+
+def _best_percentile(durations, q):
+    """
+    Returns the lowest q-th percentile over the rounds of durations.
+    """
+    return min(np.percentile(part, q) for part in np.array_split(durations, rounds))
+
+
+def _metric(value, unit, better):
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+# --- Benchmarks ---
+
+# Run in a fresh interpreter by bench_model_load(): argv is the repo directory, model path and backend
+_model_load_script = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from yield_model import load_model, synthetic_frame
+load_model(sys.argv[2], backend=sys.argv[3] or None).predict(synthetic_frame(1, seed=1))
+"""
+
+
+def bench_model_load(model_path, backend, repeats):
+    """
+    Wall time of a new Python process that imports the modules, runs load_model() and makes the first
+    prediction, as an app does at startup (an exported artifact is opened lazily, so the load alone
+    would not be comparable with unpickling). Every run pays the import cost again; the best of
+    repeats is reported.
+    """
+    command = [sys.executable, '-c', _model_load_script, os.path.dirname(os.path.abspath(__file__)),
+               model_path, backend or '']
+
+    def load_and_predict():
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise ValueError(f"Loading the model failed:\n{completed.stderr.strip()}")
+
+    return {'model_load_s': _metric(_time_calls(load_and_predict, [()] * repeats).min(), 's', 'lower')}
+
+
+def bench_single_row(model, repeats):
+    from model_artifact import compile_model
+
+    frame = synthetic_frame(repeats, seed=2)
+    rows = [(frame.iloc[[i]],) for i in range(repeats)]
+    model.predict(*rows[0])  # warm up
+    durations = _time_calls(model.predict, rows) * 1e3
+    results = {
+        'single_row_p50_ms': _metric(_best_percentile(durations, 50), 'ms', 'lower'),
+        'single_row_p99_ms': _metric(_best_percentile(durations, 99), 'ms', 'lower'),
+    }
+
+    compiled = compile_model(model)
+    if hasattr(compiled, 'predict_row'):
+        tuples = [(row,) for row in frame.itertuples(index=False, name=None)]
+        compiled.predict_row(*tuples[0])
+        durations = _time_calls(compiled.predict_row, tuples) * 1e3
+        results['single_row_fast_p50_ms'] = _metric(_best_percentile(durations, 50), 'ms', 'lower')
+        results['single_row_fast_p99_ms'] = _metric(_best_percentile(durations, 99), 'ms', 'lower')
+    return results
+
+
+def bench_batch(model, repeats):
+    results = {}
+    for size in batch_sizes:
+        frames = [(synthetic_frame(size, seed=100 + i),) for i in range(repeats)]
+        model.predict(*frames[0])
+        best = _time_calls(model.predict, frames).min()
+        results[f'batch_{size}_rows_per_s'] = _metric(size / best, 'rows/s', 'higher')
+    return results
+
+
+def bench_trend(model, model_path, repeats):
+    """
+    The dashboard's predict_trend(): every click is a new input, so all trend_horizon rows miss the cache.
+    The model is compiled as the dashboard's load_cached_model() does.
+    """
+    from model_artifact import compile_model
+    from prediction_cache import PredictionCache
+
+    cache = PredictionCache(compile_model(model), model_path=model_path)
+    frame = synthetic_frame(repeats + 1, seed=3)
+    rows = [(trend_rows(row, trend_horizon),) for row in frame.itertuples(index=False, name=None)]
+    cache.predict_rows(*rows.pop())
+    durations = _time_calls(cache.predict_rows, rows) * 1e3
+    return {
+        'trend_p50_ms': _metric(_best_percentile(durations, 50), 'ms', 'lower'),
+        'trend_p99_ms': _metric(_best_percentile(durations, 99), 'ms', 'lower'),
+    }
+
+
+def bench_figure(repeats):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    from trend_plot import TrendPlot
+
+    rng = np.random.default_rng(4)
+    years = list(range(2015, 2015 + trend_horizon))
+    start = time.perf_counter()
+    plot = TrendPlot(FigureCanvasAgg)
+    plot.update(years, list(1 + 0.05 * rng.random(trend_horizon)), 'Rice', 'Assam')
+    first = time.perf_counter() - start
+
+    # Alternate between two scales so that every update needs a full redraw
+    full = _time_calls(plot.update, [(years, list(scale * (1 + 0.05 * rng.random(trend_horizon))), 'Rice', 'Assam')
+                                     for scale in (10.0, 1.0) * (repeats // 2)])
+    # Small changes at the same scale are blitted
+    blit = _time_calls(plot.update, [(years, list(1 + 0.05 * rng.random(trend_horizon)), 'Rice', 'Assam')
+                                     for _ in range(repeats)])
+    return {
+        'figure_first_draw_ms': _metric(first * 1e3, 'ms', 'lower'),
+        'figure_full_redraw_ms': _metric(_best_percentile(full, 50) * 1e3, 'ms', 'lower'),
+        'figure_blit_ms': _metric(_best_percentile(blit[1:], 50) * 1e3, 'ms', 'lower'),
+    }
+
+
+def bench_sweep(model, repeats):
+    """
+    Points per second of an inputs_sweep() through a fresh SweepEngine each time, so nothing is memoized.
+    """
+    from model_artifact import compile_model
+    from sweep import SweepEngine, inputs_sweep
+
+    model = compile_model(model)
+    sweep = inputs_sweep(('Rice', 2020, 'Kharif', 'Assam', 1500.0, 1e6, 1e4), levels=12)
+    best = min(SweepEngine(model).run(sweep).elapsed for _ in range(repeats))
+    return {'sweep_points_per_s': _metric(sweep.size / best, 'points/s', 'higher')}
+
+
+benchmarks = ('model_load', 'single_row', 'batch', 'trend', 'figure', 'sweep')
+
+
+def run(model_path, backend=None, selected=benchmarks, quick=False):
+    """
+    Runs the selected benchmarks and returns the results document (environment and metrics).
+    """
+    import sklearn
+
+    from yield_model import load_model
+
+    repeats = 20 if quick else 200
+    metrics = {}
+    model = None
+    for name in selected:
+        if name in ('single_row', 'batch', 'trend', 'sweep') and model is None:
+            model = load_model(model_path, backend=backend)
+        if name == 'model_load':
+            metrics.update(bench_model_load(model_path, backend, 3 if quick else 5))
+        elif name == 'single_row':
+            metrics.update(bench_single_row(model, repeats))
+        elif name == 'batch':
+            metrics.update(bench_batch(model, 3 if quick else 10))
+        elif name == 'trend':
+            metrics.update(bench_trend(model, model_path, repeats))
+        elif name == 'figure':
+            metrics.update(bench_figure(repeats))
+        elif name == 'sweep':
+            metrics.update(bench_sweep(model, 2 if quick else 5))
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'machine': platform.machine(),
+            'model': model_path,
+            'backend': backend or 'brute',
+            'quick': quick,
+        },
+        'metrics': metrics,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of (metric, baseline value, new value, relative change) for every metric present in
+    both documents that got worse by more than threshold (a fraction, e.g. 0.2 for 20%).
+    """
+    regressions = []
+    for name, metric in results['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if old is None or old['value'] == 0:
+            continue
+        change = (metric['value'] - old['value']) / old['value']
+        worse = change if metric['better'] == 'lower' else -change
+        if worse > threshold:
+            regressions.append((name, old['value'], metric['value'], change))
+    return regressions
+
+
+def main(argv=None):
+    from yield_model import add_model_arguments, default_model_path
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the crop yield prediction hot paths")
+    add_model_arguments(parser)
+    parser.add_argument("--only", nargs='+', choices=benchmarks, default=list(benchmarks),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="fewer repetitions, for a smoke test")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON to PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=default_threshold,
+                        help=f"allowed relative regression against the baseline (default: {default_threshold})")
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        results = run(args.model or default_model_path(), args.backend, args.only, args.quick)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{'metric':<28} {'value':>12}  unit")
+    for name, metric in results['metrics'].items():
+        print(f"{name:<28} {metric['value']:>12.3f}  {metric['unit']}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,32 +1,25 @@
-import pickle
-import pandas as pd
+import time
+launched = time.perf_counter()
+
 import tkinter
 import tkinter.messagebox
 import customtkinter
-import os
-
-# Define the filename for the saved model
-model_filename = 'knn_crop_yield_model.pkl'
+from gui_tasks import BackgroundRunner
+from telemetry import telemetry
+from yield_model import prediction_features, crop_options, season_options, state_options
 
 # --- Load the Trained Model ---
-loaded_model = None
-try:
-    # Check if the model file exists
-    if not os.path.exists(model_filename):
-        tkinter.messagebox.showerror("Error", f"Model file '{model_filename}' not found.\nPlease make sure the model file is in the same directory as the script.")
-        exit()
-
-    print(f"Loading model from '{model_filename}'...")
-    with open(model_filename, 'rb') as f:
-        loaded_model = pickle.load(f)
-    print("Model loaded successfully.")
-
-except ImportError:
-    tkinter.messagebox.showerror("Error", "Required libraries (pandas, scikit-learn, customtkinter) not found.\nPlease install them using: pip install pandas scikit-learn customtkinter")
-    exit()
-except Exception as e:
-    tkinter.messagebox.showerror("Error", f"An error occurred while loading the model: {e}")
-    exit()
+# Unpickling the model imports scikit-learn, which takes longer than building the window, so the model
+# is loaded in the background once the window is up (see App.__init__).
+
+def load_startup():
+    """
+    Runs in the background at startup: imports the model stack and loads the model.
+    """
+    # Imported here rather than at the top so that numpy/pandas/scikit-learn do not delay the window
+    from prediction_cache import load_prediction_model
+
+    return load_prediction_model()
 
 # --- GUI Application ---
 
@@ -56,39 +49,17 @@ class App(customtkinter.CTk):
         # --- Input Widgets for Prediction ---
 
         # Define the features that the model expects
-        self.prediction_features = ['Crop', 'Crop_Year', 'Season', 'State', 'Annual_Rainfall', 'Fertilizer', 'Pesticide']
-
-        # Get unique values for dropdowns (Placeholder - replace with loading from your data)
-        # In a real application, load these from your original 'df' or a separate file.
-        self.crop_options = [
-            'Rice', 'Maize', 'Moong(Green Gram)', 'Urad', 'Groundnut', 'Sesamum',
-            'Potato', 'Sugarcane', 'Wheat', 'Rapeseed &Mustard', 'Bajra', 'Jowar',
-            'Arhar/Tur', 'Ragi', 'Gram', 'Small Millets', 'Cotton(Lint)', 'Onion',
-            'Sunflower', 'Dry Chillies', 'Other Kharif Pulses', 'Horse-Gram',
-            'Peas & Beans (Pulses)', 'Tobacco', 'Other Rabi Pulses', 'Soyabean',
-            'Turmeric', 'Masoor', 'Ginger', 'Linseed', 'Castor Seed', 'Barley',
-            'Sweet Potato', 'Garlic', 'Banana', 'Mesta', 'Tapioca', 'Coriander',
-            'Niger Seed', 'Jute', 'Coconut', 'Safflower', 'Arecanut', 'Sannhamp',
-            'Other Cereals', 'Cashewnut', 'Cowpea(Lobia)', 'Black Pepper',
-            'Other Oilseeds', 'Moth', 'Khesari', 'Cardamom', 'Guar Seed',
-            'Oilseeds Total', 'Other Summer Pulses'
-        ]
-        self.season_options = ['Kharif', 'Rabi', 'Whole Year', 'Summer', 'Autumn', 'Winter']
-        self.state_options = [
-            'Karnataka', 'Andhra Pradesh', 'West Bengal', 'Chhattisgarh', 'Bihar',
-            'Madhya Pradesh', 'Uttar Pradesh', 'Tamil Nadu', 'Gujarat', 'Maharashtra',
-            'Odisha', 'Assam', 'Uttarakhand', 'Nagaland', 'Puducherry', 'Meghalaya',
-            'Jammu And Kashmir', 'Haryana', 'Himachal Pradesh', 'Kerala', 'Manipur',
-            'Tripura', 'Mizoram', 'Punjab', 'Telangana', 'Arunachal Pradesh',
-            'Jharkhand', 'Goa', 'Sikkim', 'Delhi'
-        ]
+        self.prediction_features = prediction_features
+        self.crop_options = crop_options
+        self.season_options = season_options
+        self.state_options = state_options
 
         # Labels and Entry/OptionMenu widgets for prediction inputs
         # Placing widgets directly in the main window, in the single column (column 0)
 
         self.crop_label = customtkinter.CTkLabel(self, text="Crop Type:")
         self.crop_label.grid(row=0, column=0, padx=20, pady=(20, 5), sticky="w")
-        self.crop_optionmenu = customtkinter.CTkOptionMenu(self, values=self.crop_options)
+        self.crop_optionmenu = customtkinter.CTkOptionMenu(self, values=self.crop_options, command=self.on_input_changed)
         self.crop_optionmenu.grid(row=1, column=0, padx=20, pady=(0, 10), sticky="ew")
 
 
@@ -100,12 +71,12 @@ class App(customtkinter.CTk):
 
         self.season_label = customtkinter.CTkLabel(self, text="Season:")
         self.season_label.grid(row=4, column=0, padx=20, pady=(10, 5), sticky="w")
-        self.season_optionmenu = customtkinter.CTkOptionMenu(self, values=self.season_options)
+        self.season_optionmenu = customtkinter.CTkOptionMenu(self, values=self.season_options, command=self.on_input_changed)
         self.season_optionmenu.grid(row=5, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         self.state_label = customtkinter.CTkLabel(self, text="State:")
         self.state_label.grid(row=6, column=0, padx=20, pady=(10, 5), sticky="w")
-        self.state_optionmenu = customtkinter.CTkOptionMenu(self, values=self.state_options)
+        self.state_optionmenu = customtkinter.CTkOptionMenu(self, values=self.state_options, command=self.on_input_changed)
         self.state_optionmenu.grid(row=7, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         # --- Corrected: Added Entry for Annual Rainfall ---
@@ -126,63 +97,147 @@ class App(customtkinter.CTk):
         self.pesticide_entry.grid(row=13, column=0, padx=20, pady=(0, 10), sticky="ew")
 
 
-        # Prediction Button
-        self.predict_button = customtkinter.CTkButton(self, text="Predict Yield", command=self.predict)
+        # Prediction Button (enabled once the model has been loaded)
+        self.predict_button = customtkinter.CTkButton(self, text="Loading model...", command=self.predict, state="disabled")
         self.predict_button.grid(row=14, column=0, padx=20, pady=20, sticky="ew")
 
         # --- Corrected: Result Label for displaying Output ---
         self.result_label = customtkinter.CTkLabel(self, text="Predicted Crop Yield: --", font=customtkinter.CTkFont(size=16)) # Initial text
         self.result_label.grid(row=15, column=0, padx=20, pady=(0, 20))
 
+        # Cancel a running prediction as soon as any of the inputs it was computed from is edited
+        for entry in (self.crop_year_entry, self.annual_rainfall_entry, self.fertilizer_entry, self.pesticide_entry):
+            entry.bind("<KeyRelease>", self.on_input_changed)
+
+        # Predictions run in the background so the window stays responsive
+        self.runner = BackgroundRunner(self, on_busy_changed=self.set_busy)
+        self.submitted_inputs = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.predict_started = None
+        # F8 starts the sampling profiler, and stops it again and prints where the time went
+        self.bind("<F8>", lambda event: telemetry.toggle_profiler())
+
+        # Load the model in the background while the window is shown
+        self.model = None
+        self.loader = BackgroundRunner(self)
+        self.loader.submit(load_startup, on_done=self.model_loaded, on_error=self.show_load_error)
+        self.after_idle(lambda: print(f"Window shown {time.perf_counter() - launched:.2f} s after launch."))
+
+    def model_loaded(self, model):
+        self.model = model
+        self.predict_button.configure(text="Predict Yield", state="normal")
+        print(f"Model loaded successfully ({time.perf_counter() - launched:.2f} s after launch).")
+
+    def show_load_error(self, error):
+        if isinstance(error, FileNotFoundError):
+            tkinter.messagebox.showerror("Error", f"{error}\nPlease make sure the model file is in the same directory as the script.")
+        elif isinstance(error, ImportError):
+            tkinter.messagebox.showerror("Error", "Required libraries (pandas, scikit-learn, customtkinter) not found.\nPlease install them using: pip install pandas scikit-learn customtkinter")
+        else:
+            tkinter.messagebox.showerror("Error", f"An error occurred while loading the model: {error}")
+        self.on_close()
+
+    def set_busy(self, busy):
+        """
+        Shows or hides the busy indicator while a prediction is running.
+        """
+        self.predict_button.configure(text="Predicting..." if busy else "Predict Yield")
+        self.configure(cursor="watch" if busy else "")
+
+    def raw_inputs(self):
+        """
+        Returns the current contents of every input widget, as text.
+        """
+        return (self.crop_optionmenu.get(), self.crop_year_entry.get(), self.season_optionmenu.get(),
+                self.state_optionmenu.get(), self.annual_rainfall_entry.get(), self.fertilizer_entry.get(),
+                self.pesticide_entry.get())
+
+    def on_input_changed(self, *args):
+        """
+        Cancels the prediction in flight if the inputs it was computed from have been edited.
+        """
+        if self.runner.busy and self.raw_inputs() != self.submitted_inputs:
+            self.runner.cancel()
+            self.result_label.configure(text="Predicted Crop Yield: --")
+
+    def on_close(self):
+        self.runner.shutdown()
+        self.loader.shutdown()
+        if self.model is not None:
+            print(f"Prediction cache stats: {self.model.stats()}")
+        if telemetry.profiler is not None:
+            telemetry.toggle_profiler()
+        telemetry.dump()
+        self.destroy()
+
     def predict(self):
         """
         Retrieves input from GUI, makes prediction, and displays result in a dialog box.
         """
-        if loaded_model is None:
+        if self.model is None:
             tkinter.messagebox.showerror("Model Error", "The prediction model was not loaded.")
             self.result_label.configure(text="Predicted Crop Yield: --")  # Reset label
             return
 
         try:
-            # Get input values from the GUI widgets
-            crop = self.crop_optionmenu.get()
-            crop_year = int(self.crop_year_entry.get())
-            season = self.season_optionmenu.get()
-            state = self.state_optionmenu.get()
-            annual_rainfall = float(self.annual_rainfall_entry.get())
-            fertilizer = float(self.fertilizer_entry.get())
-            pesticide = float(self.pesticide_entry.get())
-
-            # Define features (must match training features) - important for the DataFrame
-            features = ['Crop', 'Crop_Year', 'Season', 'State', 'Annual_Rainfall', 'Fertilizer', 'Pesticide']
-
-            # Create a pandas DataFrame for the new data
-            new_data = pd.DataFrame([[crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide]],
-                                    columns=features)
-
-            # Make prediction using the loaded model
-            predicted_yield = loaded_model.predict(new_data)
-
-            # --- Display the result in a dialog box ---
-            # We can still update the label in the main window if desired,
-            # but the primary output will be the dialog.
-            self.result_label.configure(text="Predicted Crop Yield: --")  # Optional: reset label or show processing
-            tkinter.messagebox.showinfo("Prediction Result", f"The predicted crop yield is: {predicted_yield[0]:.2f}")
+            self.predict_started = time.perf_counter()
+            with telemetry.stage('parse_inputs'):
+                # Get input values from the GUI widgets
+                crop = self.crop_optionmenu.get()
+                crop_year = int(self.crop_year_entry.get())
+                season = self.season_optionmenu.get()
+                state = self.state_optionmenu.get()
+                annual_rainfall = float(self.annual_rainfall_entry.get())
+                fertilizer = float(self.fertilizer_entry.get())
+                pesticide = float(self.pesticide_entry.get())
+
+            # Make prediction in the background (served from the cache for repeated inputs)
+            row = (crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide)
+            self.submitted_inputs = self.raw_inputs()
+            self.runner.submit(self.model.predict_rows, args=([row],),
+                               on_done=self.show_prediction, on_error=self.show_prediction_error)
 
         except ValueError:
             tkinter.messagebox.showerror("Input Error",
                                          "Please enter valid numerical values for Year, Rainfall, Fertilizer, and Pesticide.")
             self.result_label.configure(text="Predicted Crop Yield: --")  # Reset result label on error
-        except Exception as e:
-            # Print the full traceback to the console for debugging
-            import traceback
-            traceback.print_exc()
-            tkinter.messagebox.showerror("Prediction Error",
-                                         f"An error occurred during prediction: {e}\nCheck console for details.")
-            self.result_label.configure(text="Predicted Crop Yield: --")  # Reset result label on error
+
+    def show_prediction(self, predicted_yield):
+        """
+        Displays the result of a background prediction in a dialog box.
+        """
+        # From the click to the result, including the wait for the main loop to poll the result
+        telemetry.record('app_predict', time.perf_counter() - self.predict_started)
+        # We can still update the label in the main window if desired,
+        # but the primary output will be the dialog.
+        self.result_label.configure(text="Predicted Crop Yield: --")  # Optional: reset label or show processing
+        tkinter.messagebox.showinfo("Prediction Result", f"The predicted crop yield is: {predicted_yield[0]:.2f}")
+
+    def show_prediction_error(self, error):
+        # Print the full traceback to the console for debugging
+        import traceback
+        traceback.print_exception(error)
+        tkinter.messagebox.showerror("Prediction Error",
+                                     f"An error occurred during prediction: {error}\nCheck console for details.")
+        self.result_label.configure(text="Predicted Crop Yield: --")  # Reset result label on error
 
 
 # --- Main execution ---
 if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Crop yield predictor")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="print an import-time profile of the startup phases instead of opening the window")
+    parser.add_argument("--telemetry", nargs="?", const="", metavar="PATH",
+                        help="time the prediction stages and, on exit, print a summary or write them to PATH (.prom or .jsonl)")
+    args = parser.parse_args()
+    if args.profile_imports:
+        import startup_profile
+        sys.exit(startup_profile.main(["crop"]))
+    if args.telemetry is not None:
+        telemetry.enable(path=args.telemetry)
+
     app = App()
     app.mainloop()
\ No newline at end of file
@@ -1,39 +1,57 @@
-import pickle
-import pandas as pd
+import time
+launched = time.perf_counter()
+
 import tkinter
 import tkinter.messagebox
 import customtkinter
-import os
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-# Define the filename for the saved model
-model_filename = 'knn_crop_yield_model.pkl'
-
-# --- Load the Trained Model ---
-loaded_model = None
-try:
-    if not os.path.exists(model_filename):
-        tkinter.messagebox.showerror("Error", f"Model file '{model_filename}' not found.\nPlease make sure the model file is in the same directory as the script.")
-        exit()
-
-    print(f"Loading model from '{model_filename}'...")
-    with open(model_filename, 'rb') as f:
-        loaded_model = pickle.load(f)
-    print("Model loaded successfully.")
-
-except ImportError:
-    tkinter.messagebox.showerror("Error", "Required libraries (pandas, scikit-learn, customtkinter, matplotlib) not found.\nPlease install them using: pip install pandas scikit-learn customtkinter matplotlib")
-    exit()
-except Exception as e:
-    tkinter.messagebox.showerror("Error", f"An error occurred while loading the model: {e}")
-    exit()
+from gui_tasks import BackgroundRunner
+from telemetry import telemetry
+from yield_model import prediction_features, crop_options, season_options, state_options, trend_horizon, trend_rows
+
+# --- Load the Trained Model and the Plotting Stack ---
+# scikit-learn (pulled in by the model) and matplotlib take longer to import than building the window,
+# so both are loaded in the background once the window is up (see App.__init__).
+
+# Sensitivity sweeps offered in the dashboard (functions of sweep.py), shown as heatmaps of their first
+# two axes at one level of the third
+sweep_kinds = {
+    "Fertilizer × Rainfall × Pesticide": 'inputs_sweep',
+    "State × Rainfall × Fertilizer": 'states_sweep',
+}
+# Least time between two redraws of a heatmap that is still being filled in
+sweep_refresh_ms = 250
+
+def load_plotting():
+    """
+    Imports matplotlib and its Tk canvas, so that the first trend plot does not wait for them.
+    """
+    import trend_plot
+    import sweep_plot
+    import matplotlib.backends.backend_tkagg
+
+
+def load_startup():
+    """
+    Runs in the background at startup: imports the model and plotting stacks and loads the model.
+    """
+    # Imported here rather than at the top so that numpy/pandas/scikit-learn do not delay the window
+    from prediction_cache import load_prediction_model
+
+    model = load_prediction_model()
+    import sweep
+    load_plotting()
+    return model
 
 # --- GUI Application ---
 class App(customtkinter.CTk):
-    def __init__(self):
+    def __init__(self, trend_horizon=trend_horizon):
+        # Checked before the Tk root window is created
+        if trend_horizon < 1:
+            raise ValueError("trend_horizon must be at least 1 year")
         super().__init__()
 
+        self.trend_horizon = trend_horizon
+
         # Configure window
         self.title("Crop Yield Predictor")
         self.geometry(f"{800}x{650}")  # Increased width to accommodate graph
@@ -51,34 +69,15 @@ class App(customtkinter.CTk):
         self.input_frame.grid_rowconfigure((0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15), weight=0)
 
         # Define features
-        self.prediction_features = ['Crop', 'Crop_Year', 'Season', 'State', 'Annual_Rainfall', 'Fertilizer', 'Pesticide']
-        self.crop_options = [
-            'Rice', 'Maize', 'Moong(Green Gram)', 'Urad', 'Groundnut', 'Sesamum',
-            'Potato', 'Sugarcane', 'Wheat', 'Rapeseed &Mustard', 'Bajra', 'Jowar',
-            'Arhar/Tur', 'Ragi', 'Gram', 'Small Millets', 'Cotton(Lint)', 'Onion',
-            'Sunflower', 'Dry Chillies', 'Other Kharif Pulses', 'Horse-Gram',
-            'Peas & Beans (Pulses)', 'Tobacco', 'Other Rabi Pulses', 'Soyabean',
-            'Turmeric', 'Masoor', 'Ginger', 'Linseed', 'Castor Seed', 'Barley',
-            'Sweet Potato', 'Garlic', 'Banana', 'Mesta', 'Tapioca', 'Coriander',
-            'Niger Seed', 'Jute', 'Coconut', 'Safflower', 'Arecanut', 'Sannhamp',
-            'Other Cereals', 'Cashewnut', 'Cowpea(Lobia)', 'Black Pepper',
-            'Other Oilseeds', 'Moth', 'Khesari', 'Cardamom', 'Guar Seed',
-            'Oilseeds Total', 'Other Summer Pulses'
-        ]
-        self.season_options = ['Kharif', 'Rabi', 'Whole Year', 'Summer', 'Autumn', 'Winter']
-        self.state_options = [
-            'Karnataka', 'Andhra Pradesh', 'West Bengal', 'Chhattisgarh', 'Bihar',
-            'Madhya Pradesh', 'Uttar Pradesh', 'Tamil Nadu', 'Gujarat', 'Maharashtra',
-            'Odisha', 'Assam', 'Uttarakhand', 'Nagaland', 'Puducherry', 'Meghalaya',
-            'Jammu And Kashmir', 'Haryana', 'Himachal Pradesh', 'Kerala', 'Manipur',
-            'Tripura', 'Mizoram', 'Punjab', 'Telangana', 'Arunachal Pradesh',
-            'Jharkhand', 'Goa', 'Sikkim', 'Delhi'
-        ]
+        self.prediction_features = prediction_features
+        self.crop_options = crop_options
+        self.season_options = season_options
+        self.state_options = state_options
 
         # Input widgets
         self.crop_label = customtkinter.CTkLabel(self.input_frame, text="Crop Type:")
         self.crop_label.grid(row=0, column=0, padx=20, pady=(20, 5), sticky="w")
-        self.crop_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.crop_options)
+        self.crop_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.crop_options, command=self.on_input_changed)
         self.crop_optionmenu.grid(row=1, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         self.crop_year_label = customtkinter.CTkLabel(self.input_frame, text="Crop Year:")
@@ -88,12 +87,12 @@ class App(customtkinter.CTk):
 
         self.season_label = customtkinter.CTkLabel(self.input_frame, text="Season:")
         self.season_label.grid(row=4, column=0, padx=20, pady=(10, 5), sticky="w")
-        self.season_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.season_options)
+        self.season_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.season_options, command=self.on_input_changed)
         self.season_optionmenu.grid(row=5, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         self.state_label = customtkinter.CTkLabel(self.input_frame, text="State:")
         self.state_label.grid(row=6, column=0, padx=20, pady=(10, 5), sticky="w")
-        self.state_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.state_options)
+        self.state_optionmenu = customtkinter.CTkOptionMenu(self.input_frame, values=self.state_options, command=self.on_input_changed)
         self.state_optionmenu.grid(row=7, column=0, padx=20, pady=(0, 10), sticky="ew")
 
         self.annual_rainfall_label = customtkinter.CTkLabel(self.input_frame, text="Annual Rainfall (mm):")
@@ -111,7 +110,8 @@ class App(customtkinter.CTk):
         self.pesticide_entry = customtkinter.CTkEntry(self.input_frame)
         self.pesticide_entry.grid(row=13, column=0, padx=20, pady=(0, 10), sticky="ew")
 
-        self.predict_button = customtkinter.CTkButton(self.input_frame, text="Predict Yield", command=self.predict)
+        # Enabled once the model has been loaded
+        self.predict_button = customtkinter.CTkButton(self.input_frame, text="Loading model...", command=self.predict, state="disabled")
         self.predict_button.grid(row=14, column=0, padx=20, pady=20, sticky="ew")
 
         self.result_label = customtkinter.CTkLabel(self.input_frame, text="Predicted Crop Yield: --", font=customtkinter.CTkFont(size=16))
@@ -123,94 +123,296 @@ class App(customtkinter.CTk):
         self.graph_frame.grid_columnconfigure(0, weight=1)
         self.graph_frame.grid_rowconfigure(0, weight=1)
 
+        # Trend of the entered inputs, and sensitivity sweeps around them
+        self.tabview = customtkinter.CTkTabview(self.graph_frame)
+        self.tabview.grid(row=0, column=0, sticky="nsew")
+        self.trend_tab = self.tabview.add("Trend")
+        self.sweep_tab = self.tabview.add("Sensitivity")
+        for tab in (self.trend_tab, self.sweep_tab):
+            tab.grid_columnconfigure(0, weight=1)
+        self.trend_tab.grid_rowconfigure(0, weight=1)
+        self.sweep_tab.grid_rowconfigure(1, weight=1)
+
         # Placeholder label for graph
-        self.placeholder_label = customtkinter.CTkLabel(self.graph_frame, text="Yield trend will appear here", font=customtkinter.CTkFont(size=16))
+        self.placeholder_label = customtkinter.CTkLabel(self.trend_tab, text="Yield trend will appear here", font=customtkinter.CTkFont(size=16))
         self.placeholder_label.grid(row=0, column=0, padx=20, pady=20)
 
+        # Created on the first prediction, then updated in place
+        self.trend_plot = None
+
+        # Sweep controls, heatmap placeholder and third-axis level slider
+        self.sweep_controls = customtkinter.CTkFrame(self.sweep_tab, fg_color="transparent")
+        self.sweep_controls.grid(row=0, column=0, sticky="ew")
+        self.sweep_controls.grid_columnconfigure(0, weight=1)
+        self.sweep_kind_optionmenu = customtkinter.CTkOptionMenu(self.sweep_controls, values=list(sweep_kinds))
+        self.sweep_kind_optionmenu.grid(row=0, column=0, padx=(0, 10), sticky="ew")
+        self.sweep_button = customtkinter.CTkButton(self.sweep_controls, text="Run Sweep", command=self.run_sweep, state="disabled")
+        self.sweep_button.grid(row=0, column=1)
+
+        self.sweep_placeholder_label = customtkinter.CTkLabel(self.sweep_tab, text="Sensitivity heatmap will appear here", font=customtkinter.CTkFont(size=16))
+        self.sweep_placeholder_label.grid(row=1, column=0, padx=20, pady=20)
+
+        self.level_slider = customtkinter.CTkSlider(self.sweep_tab, from_=0, to=1, number_of_steps=1, command=self.on_level_changed, state="disabled")
+        self.level_slider.set(0)
+        self.level_slider.grid(row=2, column=0, padx=20, pady=(10, 0), sticky="ew")
+        self.sweep_status_label = customtkinter.CTkLabel(self.sweep_tab, text="")
+        self.sweep_status_label.grid(row=3, column=0, padx=20, pady=(0, 5))
+
+        # Created on the first sweep, then updated in place
+        self.sweep_heatmap = None
+        self.sweep_engine = None
+        self.sweep_result = None
+        self.sweep_title = ''
+        self.sweep_drawn_at = 0.0
+
+        # Cancel a running prediction as soon as any of the inputs it was computed from is edited
+        for entry in (self.crop_year_entry, self.annual_rainfall_entry, self.fertilizer_entry, self.pesticide_entry):
+            entry.bind("<KeyRelease>", self.on_input_changed)
+
+        # Predictions and figure building run in the background so the window stays responsive
+        self.runner = BackgroundRunner(self, on_busy_changed=self.set_busy)
+        # Sweeps have their own runner, so that a prediction does not cancel the sweep and vice versa
+        self.sweep_runner = BackgroundRunner(self)
+        self.submitted_inputs = None
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.predict_started = None
+        # F8 starts the sampling profiler, and stops it again and prints where the time went
+        self.bind("<F8>", lambda event: telemetry.toggle_profiler())
+
+        # Load the model and the plotting stack in the background while the window is shown
+        self.model = None
+        self.loader = BackgroundRunner(self)
+        self.loader.submit(load_startup, on_done=self.model_loaded, on_error=self.show_load_error)
+        self.after_idle(lambda: print(f"Window shown {time.perf_counter() - launched:.2f} s after launch."))
+
+    def model_loaded(self, model):
+        from sweep import SweepEngine
+
+        self.model = model
+        # Sweeps bypass the prediction cache (too small for a grid) and memoize their own points
+        self.sweep_engine = SweepEngine(model.model)
+        self.predict_button.configure(text="Predict Yield", state="normal")
+        self.sweep_button.configure(state="normal")
+        print(f"Model loaded successfully ({time.perf_counter() - launched:.2f} s after launch).")
+
+    def show_load_error(self, error):
+        if isinstance(error, FileNotFoundError):
+            tkinter.messagebox.showerror("Error", f"{error}\nPlease make sure the model file is in the same directory as the script.")
+        elif isinstance(error, ImportError):
+            tkinter.messagebox.showerror("Error", "Required libraries (pandas, scikit-learn, customtkinter, matplotlib) not found.\nPlease install them using: pip install pandas scikit-learn customtkinter matplotlib")
+        else:
+            tkinter.messagebox.showerror("Error", f"An error occurred while loading the model: {error}")
+        self.on_close()
+
+    def set_busy(self, busy):
+        """
+        Shows or hides the busy indicator while a prediction is running.
+        """
+        self.predict_button.configure(text="Predicting..." if busy else "Predict Yield")
+        self.configure(cursor="watch" if busy else "")
+
+    def raw_inputs(self):
+        """
+        Returns the current contents of every input widget, as text.
+        """
+        return (self.crop_optionmenu.get(), self.crop_year_entry.get(), self.season_optionmenu.get(),
+                self.state_optionmenu.get(), self.annual_rainfall_entry.get(), self.fertilizer_entry.get(),
+                self.pesticide_entry.get())
+
+    def on_input_changed(self, *args):
+        """
+        Cancels the prediction in flight if the inputs it was computed from have been edited.
+        """
+        if self.runner.busy and self.raw_inputs() != self.submitted_inputs:
+            self.runner.cancel()
+            self.result_label.configure(text="Predicted Crop Yield: --")
+
+    def on_close(self):
+        if self.sweep_result is not None:
+            self.sweep_result.cancel()
+        self.runner.shutdown()
+        self.sweep_runner.shutdown()
+        self.loader.shutdown()
+        if self.model is not None:
+            print(f"Prediction cache stats: {self.model.stats()}")
+            print(f"Sweep stats: {self.sweep_engine.stats()}")
+        if self.trend_plot is not None:
+            print(f"Trend plot redraw stats: {self.trend_plot.stats()}")
+        if telemetry.profiler is not None:
+            telemetry.toggle_profiler()
+        telemetry.dump()
+        self.destroy()
+
+    def predict_trend(self, crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide):
+        """
+        Predicts the yield for every year of the trend horizon, starting at crop_year. Years already in
+        the prediction cache are reused and the rest are computed with a single batched model call.
+        Returns the list of years and the matching list of predicted yields.
+        """
+        rows = trend_rows((crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide), self.trend_horizon)
+        years = [row[1] for row in rows]
+        yields = self.model.predict_rows(rows).tolist()
+        return years, yields
+
     def predict(self):
         """
-        Retrieves input from GUI, makes prediction for the entered year, plots yield trend for the next 10 years,
-        and annotates the entered year's yield on the graph.
+        Retrieves input from GUI and starts the background prediction of the yield trend for the next
+        trend_horizon years. The result is shown by show_trend once it is ready.
         """
-        if loaded_model is None:
+        if self.model is None:
             tkinter.messagebox.showerror("Model Error", "The prediction model was not loaded.")
             self.result_label.configure(text="Predicted Crop Yield: --")
             return
 
         try:
-            # Get input values
-            crop = self.crop_optionmenu.get()
-            crop_year = int(self.crop_year_entry.get())
-            season = self.season_optionmenu.get()
-            state = self.state_optionmenu.get()
-            annual_rainfall = float(self.annual_rainfall_entry.get())
-            fertilizer = float(self.fertilizer_entry.get())
-            pesticide = float(self.pesticide_entry.get())
-
-            # --- Single Prediction for Entered Year ---
-            new_data = pd.DataFrame([[crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide]],
-                                    columns=self.prediction_features)
-            predicted_yield = loaded_model.predict(new_data)[0]
-            self.result_label.configure(text=f"Predicted Crop Yield for {crop_year}: {predicted_yield:.2f}")
-
-            # --- Predictions for Next 10 Years ---
-            years = list(range(crop_year, crop_year + 10))
-            yields = []
-            for year in years:
-                new_data = pd.DataFrame([[crop, year, season, state, annual_rainfall, fertilizer, pesticide]],
-                                        columns=self.prediction_features)
-                pred = loaded_model.predict(new_data)[0]
-                yields.append(pred)
-
-            # --- Plot the Yield Trend ---
-            # Clear previous graph
-            for widget in self.graph_frame.winfo_children():
-                widget.destroy()
-
-            # Create new plot with dark theme
-            fig, ax = plt.subplots(figsize=(5, 3), facecolor='#2b2b2b')  # Dark background
-            ax.set_facecolor('#2b2b2b')  # Dark plot background
-            ax.plot(years, yields, marker='o', color='#00CC96', linewidth=2)  # Bright line color
-            ax.set_title(f"Yield Trend for {crop} in {state}", color='white')
-            ax.set_xlabel("Year", color='white')
-            ax.set_ylabel("Predicted Yield", color='white')
-            ax.grid(True, color='gray', linestyle='--', alpha=0.5)
-            ax.tick_params(axis='both', colors='white')
-
-            # Annotate the entered year's yield
-            ax.annotate(
-                f'{predicted_yield:.2f}',
-                xy=(crop_year, predicted_yield),
-                xytext=(crop_year, predicted_yield + 0.1 * (max(yields) - min(yields))),  # Offset above point
-                color='white',
-                fontsize=10,
-                bbox=dict(facecolor='black', alpha=0.5, edgecolor='white'),
-                ha='center'
-            )
-            ax.scatter([crop_year], [predicted_yield], color='yellow', s=100, zorder=5)  # Highlight entered year
-
-            plt.tight_layout()
-
-            # Embed plot in GUI
-            canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-            canvas.draw()
-            canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew")
+            self.predict_started = time.perf_counter()
+            with telemetry.stage('parse_inputs'):
+                inputs = self.read_inputs()
+            self.submitted_inputs = self.raw_inputs()
+            self.runner.submit(self.build_trend, args=inputs, on_done=self.show_trend, on_error=self.show_prediction_error)
 
         except ValueError:
             tkinter.messagebox.showerror("Input Error",
                                          "Please enter valid numerical values for Year, Rainfall, Fertilizer, and Pesticide.")
             self.result_label.configure(text="Predicted Crop Yield: --")
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            tkinter.messagebox.showerror("Prediction Error",
-                                         f"An error occurred during prediction: {e}\nCheck console for details.")
-            self.result_label.configure(text="Predicted Crop Yield: --")
+
+    def read_inputs(self):
+        """
+        Returns the inputs as a 7-tuple in prediction feature order. Raises ValueError if a numeric entry
+        does not parse.
+        """
+        # Get input values
+        crop = self.crop_optionmenu.get()
+        crop_year = int(self.crop_year_entry.get())
+        season = self.season_optionmenu.get()
+        state = self.state_optionmenu.get()
+        annual_rainfall = float(self.annual_rainfall_entry.get())
+        fertilizer = float(self.fertilizer_entry.get())
+        pesticide = float(self.pesticide_entry.get())
+        return crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide
+
+    def build_trend(self, crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide):
+        """
+        Runs in the background: predicts the whole horizon (the first point is the entered year).
+        Returns (crop, state, years, yields) for show_trend.
+        """
+        years, yields = self.predict_trend(crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide)
+        return crop, state, years, yields
+
+    def show_trend(self, result):
+        """
+        Displays the result of a background trend prediction: updates the label and redraws the trend
+        plot, annotating the entered year's yield. The figure and canvas are reused between predictions.
+        """
+        crop, state, years, yields = result
+        self.result_label.configure(text=f"Predicted Crop Yield for {years[0]}: {yields[0]:.2f}")
+        # From the click to the result, including the wait for the main loop to poll the result
+        telemetry.record('app_predict', time.perf_counter() - self.predict_started)
+
+        if self.trend_plot is None:
+            # Already imported in the background by load_plotting()
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from trend_plot import TrendPlot
+
+            # Replace the placeholder with the plot, embedded once
+            self.placeholder_label.destroy()
+            self.trend_plot = TrendPlot(FigureCanvasTkAgg, master=self.trend_tab)
+            self.trend_plot.canvas.get_tk_widget().grid(row=0, column=0, sticky="nsew")
+        with telemetry.stage('plot_update'):
+            self.trend_plot.update(years, yields, crop, state)
+
+    def run_sweep(self):
+        """
+        Starts the selected sensitivity sweep around the entered inputs (the swept ones are ignored). The
+        heatmap is redrawn from the partial result while the sweep runs.
+        """
+        import sweep
+
+        try:
+            inputs = self.read_inputs()
+        except ValueError:
+            tkinter.messagebox.showerror("Input Error",
+                                         "Please enter valid numerical values for Year, Rainfall, Fertilizer, and Pesticide.")
+            return
+        if self.sweep_result is not None:
+            self.sweep_result.cancel()  # stops the sweep in flight after its current chunk
+
+        # The cache reloads its model when the model file changes; the engine then drops its memo
+        self.sweep_engine.set_model(self.model.model)
+        new_sweep = getattr(sweep, sweep_kinds[self.sweep_kind_optionmenu.get()])(inputs)
+        self.sweep_result = sweep.SweepResult(new_sweep)
+        self.sweep_title = f"{inputs[0]}, {inputs[1]}" + ("" if new_sweep.axes[0][0] == 'State' else f", {inputs[3]}")
+        self.sweep_drawn_at = 0.0
+
+        levels = new_sweep.shape[2] if len(new_sweep.shape) > 2 else 1
+        self.level_slider.configure(to=max(levels - 1, 1), number_of_steps=max(levels - 1, 1),
+                                    state="normal" if levels > 1 else "disabled")
+        self.level_slider.set(0)
+        self.sweep_status_label.configure(text=f"Sweeping {new_sweep.size:,} points...")
+        self.sweep_runner.submit(self.sweep_engine.run, args=(new_sweep, self.sweep_result),
+                                 on_done=self.show_sweep, on_error=self.show_prediction_error,
+                                 on_progress=self.show_sweep_progress)
+
+    def show_sweep_progress(self):
+        """
+        Redraws the heatmap from the partial sweep result, at most every sweep_refresh_ms.
+        """
+        if self.sweep_result.done and time.perf_counter() - self.sweep_drawn_at >= sweep_refresh_ms / 1e3:
+            self.draw_sweep()
+
+    def show_sweep(self, result):
+        self.draw_sweep()
+        self.sweep_status_label.configure(
+            text=f"{result.sweep.size:,} points in {result.elapsed:.1f} s ({result.memo_hits:,} reused)")
+
+    def on_level_changed(self, value):
+        if self.sweep_result is not None and self.sweep_heatmap is not None:
+            self.draw_sweep()
+
+    def draw_sweep(self):
+        if self.sweep_heatmap is None:
+            # Already imported in the background by load_plotting()
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from sweep_plot import SweepHeatmap
+
+            self.sweep_placeholder_label.destroy()
+            self.sweep_heatmap = SweepHeatmap(FigureCanvasTkAgg, master=self.sweep_tab)
+            self.sweep_heatmap.canvas.get_tk_widget().grid(row=1, column=0, sticky="nsew")
+        level = int(round(self.level_slider.get())) if self.sweep_result.values.ndim > 2 else 0
+        with telemetry.stage('heatmap_update'):
+            self.sweep_heatmap.update(self.sweep_result, level, self.sweep_title)
+        self.sweep_drawn_at = time.perf_counter()
+
+    def show_prediction_error(self, error):
+        import traceback
+        traceback.print_exception(error)
+        tkinter.messagebox.showerror("Prediction Error",
+                                     f"An error occurred during prediction: {error}\nCheck console for details.")
+        self.result_label.configure(text="Predicted Crop Yield: --")
 
 # --- Main execution ---
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crop yield prediction dashboard")
+    parser.add_argument("--horizon", type=int, default=trend_horizon,
+                        help=f"number of years shown in the yield trend (default: {trend_horizon})")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="print an import-time profile of the startup phases instead of opening the window")
+    parser.add_argument("--telemetry", nargs="?", const="", metavar="PATH",
+                        help="time the prediction stages and, on exit, print a summary or write them to PATH (.prom or .jsonl)")
+    args = parser.parse_args()
+    if args.horizon < 1:
+        parser.error("--horizon must be at least 1 year")
+    if args.profile_imports:
+        import sys
+        import startup_profile
+        sys.exit(startup_profile.main(["dashboard"]))
+    if args.telemetry is not None:
+        telemetry.enable(path=args.telemetry)
+
     customtkinter.set_appearance_mode("Dark")
     customtkinter.set_default_color_theme("blue")
     customtkinter.set_widget_scaling(1.0)
-    app = App()
+    app = App(trend_horizon=args.horizon)
     app.mainloop()
\ No newline at end of file
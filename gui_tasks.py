@@ -0,0 +1,73 @@
+"""
+Runs slow work (model inference, figure construction) off the Tk main loop.
+
+Tk widgets may only be touched from the main thread, so BackgroundRunner submits work to a thread
+pool and polls the future with widget.after(); the completion callbacks therefore run on the main
+thread. Submitting new work or calling cancel() supersedes the request in flight: its result is
+dropped even if the computation was already running. Work that publishes partial results (e.g. a
+sweep.SweepResult) can be shown as it progresses with on_progress, also called from the polling loop.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+# How often the main loop checks for a finished background request
+poll_interval_ms = 30
+
+
+class BackgroundRunner:
+    def __init__(self, widget, on_busy_changed=None, poll_interval=poll_interval_ms):
+        self.widget = widget
+        self.on_busy_changed = on_busy_changed
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='predict')
+        self._future = None
+        self._request_id = 0
+
+    @property
+    def busy(self):
+        return self._future is not None
+
+    def _set_future(self, future):
+        was_busy = self.busy
+        self._future = future
+        if self.on_busy_changed is not None and was_busy != self.busy:
+            self.on_busy_changed(self.busy)
+
+    def submit(self, fn, args=(), on_done=None, on_error=None, on_progress=None):
+        """
+        Runs fn(*args) in the background, then calls on_done(result) or on_error(exception) on the main
+        thread. on_progress(), if given, is called on the main thread at every poll while fn runs. Any
+        request still in flight is cancelled first.
+        """
+        self.cancel()
+        self._request_id += 1
+        self._set_future(self._executor.submit(fn, *args))
+        self.widget.after(self.poll_interval, self._poll, self._request_id, self._future, on_done, on_error, on_progress)
+
+    def _poll(self, request_id, future, on_done, on_error, on_progress=None):
+        if request_id != self._request_id:
+            return  # superseded or cancelled
+        if not future.done():
+            if on_progress is not None:
+                on_progress()
+            self.widget.after(self.poll_interval, self._poll, request_id, future, on_done, on_error, on_progress)
+            return
+        self._set_future(None)
+        error = future.exception()
+        if error is not None:
+            if on_error is not None:
+                on_error(error)
+        elif on_done is not None:
+            on_done(future.result())
+
+    def cancel(self):
+        """
+        Drops the request in flight, if any. It is never reported, even if it was already running.
+        """
+        if self._future is not None:
+            self._request_id += 1
+            self._future.cancel()
+            self._set_future(None)
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
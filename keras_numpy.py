@@ -0,0 +1,230 @@
+"""
+Pure-NumPy inference for the Keras network in crop_yield_model.h5.
+
+The layer configuration and weights are read straight from the HDF5 file with h5py; the forward pass is
+one float32 matmul per Dense layer (Dropout is the identity at inference), so TensorFlow is not needed at
+runtime. Only Sequential models of Dense, Dropout and InputLayer layers are supported.
+
+The network takes the encoded feature matrix, not raw records, so NetworkModel pairs it with a fitted
+preprocessor: the pickled transformer next to the network (crop_yield_model_preprocessor.pkl) if it has
+been exported, else the ColumnTransformer of the KNN pipeline. The width of the preprocessor output must
+match the network input, otherwise loading raises ValueError.
+
+Usage (latency and accuracy comparison against the KNN model on synthetic rows):
+    python keras_numpy.py --rows 2000
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from telemetry import telemetry
+from yield_model import model_filename, prediction_features
+
+network_filename = 'crop_yield_model.h5'
+
+
+def _softmax(x):
+    x = np.exp(x - x.max(axis=1, keepdims=True))
+    return x / x.sum(axis=1, keepdims=True)
+
+
+activations = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': _softmax,
+}
+
+
+def _layer_weights(group):
+    """
+    Returns the kernel and bias datasets found anywhere below a layer's weight group. Keras 3 files name
+    them 'kernel' and 'bias', Keras 2 files 'kernel:0' and 'bias:0'.
+    """
+    found = {}
+
+    def visit(name, item):
+        leaf = name.rsplit('/', 1)[-1].split(':')[0]
+        if leaf in ('kernel', 'bias') and hasattr(item, 'shape'):
+            found[leaf] = np.asarray(item, dtype=np.float32)
+
+    group.visititems(visit)
+    return found.get('kernel'), found.get('bias')
+
+
+class DenseNetwork:
+    """
+    A stack of (kernel, bias, activation) Dense layers evaluated with NumPy.
+    """
+
+    def __init__(self, layers):
+        self.layers = layers
+        self.n_features_in = layers[0][0].shape[0]
+
+    @classmethod
+    def from_h5(cls, path):
+        import h5py
+
+        with h5py.File(path, 'r') as f:
+            config = f.attrs.get('model_config')
+            if config is None:
+                raise ValueError(f"'{path}' holds no Keras model configuration")
+            config = json.loads(config)
+            if config.get('class_name') != 'Sequential':
+                raise ValueError(f"Only Sequential Keras models are supported, '{path}' is a {config.get('class_name')}")
+            weights = f['model_weights'] if 'model_weights' in f else f
+
+            layers = []
+            for layer in config['config']['layers']:
+                kind, options = layer['class_name'], layer['config']
+                if kind in ('InputLayer', 'Dropout'):
+                    continue
+                if kind != 'Dense':
+                    raise ValueError(f"Unsupported Keras layer type '{kind}' in '{path}'")
+                activation = options.get('activation', 'linear')
+                if activation not in activations:
+                    raise ValueError(f"Unsupported activation '{activation}' in layer '{options['name']}'")
+                kernel, bias = _layer_weights(weights[options['name']])
+                if kernel is None:
+                    raise ValueError(f"No weights for layer '{options['name']}' in '{path}'")
+                if bias is None or not options.get('use_bias', True):
+                    bias = np.zeros(kernel.shape[1], dtype=np.float32)
+                layers.append((kernel, bias, activation))
+        if not layers:
+            raise ValueError(f"'{path}' has no Dense layers")
+        return cls(layers)
+
+    def forward(self, encoded):
+        """
+        Returns the network output for a 2-D array of encoded rows (float32, one column per output unit).
+        """
+        x = np.asarray(encoded, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            x = x @ kernel
+            x += bias
+            x = activations[activation](x)
+        return x
+
+    def describe(self):
+        return " -> ".join([str(self.n_features_in)] + [f"{kernel.shape[1]} {activation}" for kernel, _, activation in self.layers])
+
+
+def preprocessor_path(network_path):
+    """
+    Returns where the preprocessor the network was trained with is expected: <network>_preprocessor.pkl.
+    """
+    return os.path.splitext(network_path)[0] + '_preprocessor.pkl'
+
+
+def load_preprocessor(network_path, knn_path=model_filename):
+    """
+    Returns (fitted preprocessor, where it came from): the network's own exported preprocessor if present,
+    else the ColumnTransformer of the KNN pipeline.
+    """
+    path = preprocessor_path(network_path)
+    if not os.path.exists(path):
+        path = knn_path
+    with open(path, 'rb') as f:
+        preprocessor = pickle.load(f)
+    if hasattr(preprocessor, 'named_steps'):
+        preprocessor = preprocessor[:-1]  # a whole pipeline: keep everything but the estimator
+    return preprocessor, path
+
+
+class NetworkModel:
+    """
+    Predicts from raw records (a DataFrame with the prediction feature columns) with a preprocessor and a
+    DenseNetwork. Raises ValueError if the preprocessor output does not have the network's input width.
+    """
+
+    def __init__(self, network, preprocessor, preprocessor_source='preprocessor'):
+        width = len(preprocessor.get_feature_names_out())
+        if width != network.n_features_in:
+            raise ValueError(f"The network expects {network.n_features_in} input features but {preprocessor_source} "
+                             f"produces {width}; it was trained with a different encoding. Export the fitted "
+                             f"preprocessor the network was trained with next to it as *_preprocessor.pkl.")
+        self.network = network
+        self.preprocessor = preprocessor
+
+    @classmethod
+    def from_h5(cls, path, knn_path=model_filename):
+        network = DenseNetwork.from_h5(path)
+        preprocessor, source = load_preprocessor(path, knn_path)
+        return cls(network, preprocessor, f"the preprocessor of '{source}'")
+
+    def predict(self, X):
+        with telemetry.stage('encode'):
+            encoded = self.preprocessor.transform(X[prediction_features])
+            if hasattr(encoded, 'toarray'):
+                encoded = encoded.toarray()
+        with telemetry.stage('network_forward'):
+            return self.network.forward(encoded)[:, 0].astype(np.float64)
+
+
+# --- Comparison against the KNN model ---
+
+def _best_time(fn, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare(network_path, knn_path, rows, batch_sizes=(1, 256, 4096)):
+    """
+    Prints the latency of the NumPy forward pass and of the KNN pipeline at several batch sizes and, if
+    the network can be paired with a matching preprocessor, how closely its predictions follow the KNN's.
+    """
+    from yield_model import load_model, synthetic_frame
+
+    network = DenseNetwork.from_h5(network_path)
+    knn = load_model(knn_path)
+    preprocessor = knn[:-1]
+    print(f"network: {network.describe()}")
+
+    print(f"{'batch':>6} {'preprocess ms':>14} {'network fwd ms':>15} {'KNN predict ms':>15}")
+    for size in batch_sizes:
+        frame = synthetic_frame(size, seed=5)
+        encoded = np.random.default_rng(5).standard_normal((size, network.n_features_in)).astype(np.float32)
+        print(f"{size:>6} {_best_time(lambda: preprocessor.transform(frame)) * 1e3:>14.3f} "
+              f"{_best_time(lambda: network.forward(encoded)) * 1e3:>15.3f} "
+              f"{_best_time(lambda: knn.predict(frame)) * 1e3:>15.3f}")
+
+    try:
+        model = NetworkModel.from_h5(network_path, knn_path)
+    except ValueError as e:
+        print(f"accuracy comparison skipped: {e}")
+        return
+    frame = synthetic_frame(rows, seed=6)
+    network_predictions = model.predict(frame)
+    knn_predictions = knn.predict(frame)
+    difference = np.abs(network_predictions - knn_predictions)
+    print(f"network vs KNN on {rows} synthetic rows: mean |diff| {difference.mean():.4f}, "
+          f"max |diff| {difference.max():.4f}, correlation {np.corrcoef(network_predictions, knn_predictions)[0, 1]:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare NumPy inference of the Keras network with the KNN model")
+    parser.add_argument("--network", default=network_filename, help=f"Keras HDF5 file (default: {network_filename})")
+    parser.add_argument("--knn", default=model_filename, help=f"pickled KNN pipeline (default: {model_filename})")
+    parser.add_argument("--rows", type=int, default=2000, help="synthetic rows for the accuracy comparison")
+    args = parser.parse_args(argv)
+
+    try:
+        compare(args.network, args.knn, args.rows)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Load generator for the local prediction service (serve.py).
+
+Opens --connections keep-alive connections to the service and sends --requests requests in total,
+drawn from synthetic inputs and mixed between single /predict records, /predict lists of
+--list-size records and /trend requests. Prints the client-side p50/p99 latency and throughput,
+then the service's own /metrics.
+
+Usage:
+    python serve.py --port 8000 &
+    python loadgen.py --port 8000 --connections 32 --requests 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from serve import default_port
+from yield_model import synthetic_frame
+
+request_kinds = ('predict', 'list', 'trend')
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """
+    Sends one HTTP/1.1 request on an open connection and returns (status, decoded JSON body).
+    """
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+def make_requests(count, kinds, list_size, seed=0):
+    """
+    Returns count (path, payload) pairs built from synthetic records.
+    """
+    records = synthetic_frame(max(count, list_size), seed=seed).to_dict('records')
+    records = [{name: value.item() if hasattr(value, 'item') else value for name, value in record.items()}
+               for record in records]
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        if kind == 'list':
+            requests.append(('/predict', rng.sample(records, list_size)))
+        else:
+            requests.append(('/predict' if kind == 'predict' else '/trend', records[i]))
+    return requests
+
+
+async def run_load(host, port, requests, connections):
+    """
+    Sends requests over connections concurrent connections. Returns (latencies in seconds, error count,
+    elapsed seconds).
+    """
+    pending = list(reversed(requests))
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while pending:
+                path, payload = pending.pop()
+                started = time.perf_counter()
+                status, _ = await http_request(reader, writer, 'POST', path, payload)
+                latencies.append(time.perf_counter() - started)
+                if status != 200:
+                    errors += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def fetch_metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await http_request(reader, writer, 'GET', '/metrics'))[1]
+    finally:
+        writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the local prediction service")
+    parser.add_argument("--host", default="127.0.0.1", help="service host (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=default_port, help=f"service port (default: {default_port})")
+    parser.add_argument("--connections", type=int, default=32, help="number of concurrent connections")
+    parser.add_argument("--requests", type=int, default=2000, help="total number of requests to send")
+    parser.add_argument("--mix", default=','.join(request_kinds),
+                        help=f"comma-separated request kinds to cycle through (from {', '.join(request_kinds)})")
+    parser.add_argument("--list-size", type=int, default=8, help="records per /predict list request")
+    args = parser.parse_args(argv)
+
+    kinds = args.mix.split(',')
+    unknown = [kind for kind in kinds if kind not in request_kinds]
+    if unknown:
+        parser.error(f"unknown request kind(s): {', '.join(unknown)}")
+
+    requests = make_requests(args.requests, kinds, args.list_size)
+    try:
+        latencies, errors, elapsed = asyncio.run(run_load(args.host, args.port, requests, args.connections))
+        metrics = asyncio.run(fetch_metrics(args.host, args.port))
+    except OSError as e:
+        print(f"Error: cannot reach the service at {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+
+    latencies.sort()
+    print(f"requests: {len(latencies)}  errors: {errors}  connections: {args.connections}  mix: {args.mix}")
+    print(f"client latency: p50 {latencies[len(latencies) // 2] * 1e3:.2f} ms  "
+          f"p99 {latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1e3:.2f} ms")
+    print(f"throughput: {len(latencies) / elapsed:,.0f} requests/s")
+    print(f"service metrics: {json.dumps(metrics)}")
+    return 0 if errors == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
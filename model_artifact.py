@@ -0,0 +1,441 @@
+"""
+Memory-mapped export of the trained KNN pipeline.
+
+Unpickling knn_crop_yield_model.pkl imports scikit-learn and copies the whole training matrix into
+every process that loads it. export_artifact() writes the fitted scaler statistics, the encoded
+training set and the regressor settings as plain .npy arrays plus a small JSON manifest.
+MappedKNNModel opens those arrays with np.load(mmap_mode='r') on the first predict call, so startup
+costs nothing and worker processes that load the same artifact share its pages through the OS cache.
+
+The training matrix is stored densely in the pipeline's encoded space (scaled numeric columns followed
+by the one-hot blocks) so that distances are one BLAS matrix product per block of queries, using the
+same |q|^2 - 2 q.t + |t|^2 expansion as scikit-learn.
+
+predict_row() and predict_rows() take raw 7-tuples in prediction feature order and skip pandas
+altogether: a row is encoded into a preallocated vector and, since all but the numeric entries of the
+query are zero, its dot products with the training rows need only the numeric columns plus one column
+per known category, read from the transposed training matrix that the artifact stores next to fit_X.
+compile_model() builds a MappedKNNModel in memory from the unpickled pipeline, so the pickled model gets
+the same path; load_cached_model() in prediction_cache.py does this for the apps.
+
+Usage:
+    python model_artifact.py export [--model knn_crop_yield_model.pkl] [--out knn_crop_yield_model]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+import numpy as np
+
+from telemetry import telemetry
+
+# Bumped whenever the on-disk layout changes
+artifact_version = 1
+
+manifest_filename = 'manifest.json'
+
+# Number of query rows whose distances to the training set are computed at once
+query_block_size = 256
+
+# predict_rows() predicts up to this many rows one at a time with the single-row path
+single_row_limit = 32
+
+
+def file_sha256(path):
+    """
+    Returns the hex SHA-256 digest of a file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pipeline_arrays(pipeline):
+    """
+    Returns (arrays, manifest) describing a fitted Pipeline(preprocessor, regressor): the NumPy arrays
+    stored by an artifact and its manifest (without the source hash).
+    """
+    preprocessor = pipeline.named_steps['preprocessor']
+    regressor = pipeline.named_steps['regressor']
+    scaler = preprocessor.named_transformers_['num']
+    encoder = preprocessor.named_transformers_['cat']
+    numeric_columns = list(preprocessor.transformers_[0][2])
+    categorical_columns = list(preprocessor.transformers_[1][2])
+
+    if encoder.drop_idx_ is not None:
+        raise ValueError("One-hot encoders with dropped categories are not supported")
+    if regressor.effective_metric_ != 'euclidean':
+        raise ValueError(f"Unsupported KNN metric '{regressor.effective_metric_}'")
+
+    fit_X = regressor._fit_X
+    fit_X = np.ascontiguousarray(fit_X.toarray() if hasattr(fit_X, 'toarray') else fit_X, dtype=np.float64)
+    if fit_X.shape[1] != len(numeric_columns) + sum(len(c) for c in encoder.categories_):
+        raise ValueError("Expected the encoded space to be the numeric columns followed by the one-hot blocks")
+
+    arrays = {
+        'scaler_mean': np.asarray(scaler.mean_, dtype=np.float64),
+        'scaler_scale': np.asarray(scaler.scale_, dtype=np.float64),
+        'fit_X': fit_X,
+        # Read row by row by the single-row path, see MappedKNNModel.predict_row()
+        'fit_T': np.ascontiguousarray(fit_X.T),
+        'fit_sq_norms': np.einsum('ij,ij->i', fit_X, fit_X),
+        'fit_y': np.asarray(regressor._y, dtype=np.float64),
+    }
+    manifest = {
+        'artifact_version': artifact_version,
+        'feature_names': [str(name) for name in pipeline.feature_names_in_],
+        'numeric_columns': numeric_columns,
+        'categorical_columns': categorical_columns,
+        'categories': [[str(value) for value in categories] for categories in encoder.categories_],
+        'n_neighbors': int(regressor.n_neighbors),
+        'weights': regressor.weights,
+        'n_samples': int(fit_X.shape[0]),
+    }
+    return arrays, manifest
+
+
+def staging_directory(directory):
+    """
+    Returns a new empty directory next to directory (so on the same file system) to write files into
+    before publish_directory() moves them in.
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f'.{os.path.basename(os.path.abspath(directory))}.', dir=parent)
+
+
+def publish_directory(staging, directory, last=manifest_filename):
+    """
+    Moves every file of staging into directory with os.replace(), the file named last after all others,
+    and removes staging. Replaced files are unlinked rather than overwritten, so processes that have
+    them memory-mapped keep reading the old contents instead of crashing with SIGBUS.
+    """
+    os.makedirs(directory, exist_ok=True)
+    names = sorted(os.listdir(staging), key=lambda name: name == last)
+    for name in names:
+        os.replace(os.path.join(staging, name), os.path.join(directory, name))
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def export_artifact(pipeline, directory, source_path=None):
+    """
+    Writes the arrays and manifest describing a fitted Pipeline(preprocessor, regressor) to directory.
+    The files are written to a staging directory and moved in with the manifest last (see
+    publish_directory()), so re-exporting is safe while the artifact is in use.
+    """
+    arrays, manifest = pipeline_arrays(pipeline)
+    manifest['source_sha256'] = file_sha256(source_path) if source_path else None
+    staging = staging_directory(directory)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, f'{name}.npy'), array)
+        with open(os.path.join(staging, manifest_filename), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        publish_directory(staging, directory)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+def non_finite_error(values):
+    """
+    Returns the ValueError scikit-learn raises for numeric input holding NaN or infinite values.
+    """
+    if np.isnan(values).any():
+        return ValueError("Input X contains NaN.")
+    return ValueError("Input X contains infinity or a value too large for dtype('float64').")
+
+
+def is_artifact(path):
+    """
+    Returns True if path is a directory containing an exported model artifact.
+    """
+    return os.path.isfile(os.path.join(path, manifest_filename))
+
+
+class MappedKNNModel:
+    """
+    KNN regressor backed by a memory-mapped artifact directory, with the same predict() interface as
+    the pickled pipeline. Nothing is read from disk until the first prediction.
+
+    backend selects the neighbour search (see neighbour_search.backends): 'brute' (exact, the
+    default), 'kdtree' (exact) or 'rpforest' (experimental, approximate). backend_options are passed to it.
+    """
+
+    def __init__(self, directory, backend='brute', backend_options=None):
+        from neighbour_search import backends
+
+        if not is_artifact(directory):
+            raise FileNotFoundError(f"Model artifact '{directory}' not found.")
+        if backend not in backends:
+            raise ValueError(f"Unknown neighbour search backend '{backend}' (expected one of: {', '.join(backends)})")
+        self.directory = directory
+        self.backend = backend
+        self.backend_options = backend_options or {}
+        self._loaded = False
+
+    @classmethod
+    def from_pipeline(cls, pipeline, backend='brute', backend_options=None):
+        """
+        Builds the model in memory from a fitted pipeline (e.g. the unpickled knn_crop_yield_model.pkl),
+        for its pandas-free predict_rows() path. Predictions match pipeline.predict().
+        """
+        from neighbour_search import backends
+
+        if backend not in backends:
+            raise ValueError(f"Unknown neighbour search backend '{backend}' (expected one of: {', '.join(backends)})")
+        model = cls.__new__(cls)
+        model.directory = None
+        model.backend = backend
+        model.backend_options = backend_options or {}
+        arrays, manifest = pipeline_arrays(pipeline)
+        model._setup(manifest, arrays)
+        return model
+
+    def _load(self):
+        with open(os.path.join(self.directory, manifest_filename)) as f:
+            manifest = json.load(f)
+        if manifest['artifact_version'] != artifact_version:
+            raise ValueError(f"Unsupported model artifact version {manifest['artifact_version']}")
+        names = ('scaler_mean', 'scaler_scale', 'fit_X', 'fit_T', 'fit_sq_norms', 'fit_y')
+        # fit_T is missing from artifacts exported before it was added; predict_row() then transposes fit_X
+        self._setup(manifest, {name: np.load(os.path.join(self.directory, f'{name}.npy'), mmap_mode='r')
+                               for name in names if os.path.exists(os.path.join(self.directory, f'{name}.npy'))})
+
+    def _setup(self, manifest, arrays):
+        self.manifest = manifest
+        self.feature_names = manifest['feature_names']
+        self.numeric_columns = manifest['numeric_columns']
+        self.categorical_columns = manifest['categorical_columns']
+        self.category_codes = [{value: code for code, value in enumerate(categories)}
+                               for categories in manifest['categories']]
+        self.n_neighbors = manifest['n_neighbors']
+        self.weights = manifest['weights']
+        self.scaler_mean = arrays['scaler_mean']
+        self.scaler_scale = arrays['scaler_scale']
+        self.fit_X = arrays['fit_X']
+        self.fit_sq_norms = arrays['fit_sq_norms']
+        self.fit_y = arrays['fit_y']
+        # Column offset of each one-hot block in the encoded space
+        self.category_offsets = np.cumsum([len(self.numeric_columns)] + [len(c) for c in manifest['categories'][:-1]])
+        # Where each raw feature of a 7-tuple goes: (tuple position, numeric column) and (tuple position,
+        # categorical column)
+        self._numeric_positions = [self.feature_names.index(name) for name in self.numeric_columns]
+        self._categorical_positions = [self.feature_names.index(name) for name in self.categorical_columns]
+        self._fit_T = arrays.get('fit_T')
+        self._buffers = threading.local()
+        self._loaded = True
+
+        from neighbour_search import backends
+        self.search = backends[self.backend](self, **self.backend_options)
+
+    def encode(self, X):
+        """
+        Returns the rows of a DataFrame holding the feature columns in the encoded space: scaled
+        numeric columns followed by the one-hot blocks (all zeros for unknown categories). Raises
+        ValueError if a numeric value is NaN or infinite, as the pickled pipeline does.
+        """
+        if not self._loaded:
+            self._load()
+        with telemetry.stage('encode'):
+            encoded = np.zeros((len(X), self.fit_X.shape[1]))
+            n_numeric = len(self.numeric_columns)
+            numeric = X[self.numeric_columns].to_numpy(dtype=np.float64)
+            if not np.isfinite(numeric).all():
+                raise non_finite_error(numeric)
+            encoded[:, :n_numeric] = (numeric - self.scaler_mean) / self.scaler_scale
+            rows = np.arange(len(X))
+            for i, column in enumerate(self.categorical_columns):
+                lookup = self.category_codes[i]
+                codes = np.fromiter((lookup.get(value, -1) for value in X[column]), dtype=np.intp, count=len(X))
+                known = codes >= 0
+                encoded[rows[known], self.category_offsets[i] + codes[known]] = 1.0
+        return encoded
+
+    def squared_distances(self, encoded):
+        """
+        Returns the (queries x training rows) squared Euclidean distances of encoded queries.
+        """
+        distances = encoded @ self.fit_X.T
+        distances *= -2.0
+        distances += self.fit_sq_norms
+        distances += np.einsum('ij,ij->i', encoded, encoded)[:, None]
+        np.maximum(distances, 0.0, out=distances)
+        return distances
+
+    def predict_encoded(self, encoded):
+        """
+        Predicts from already encoded queries, processing query_block_size rows at a time.
+        """
+        k = self.n_neighbors
+        predictions = np.empty(encoded.shape[0])
+        for start in range(0, encoded.shape[0], query_block_size):
+            stop = start + query_block_size
+            with telemetry.stage('neighbour_search'):
+                distances, neighbours = self.search.kneighbors(encoded[start:stop], k)
+            neighbour_y = self.fit_y[neighbours]
+            if self.weights == 'distance':
+                with np.errstate(divide='ignore'):
+                    weights = 1.0 / np.sqrt(distances)
+                # Exact matches take all the weight, as in scikit-learn
+                exact = np.isinf(weights)
+                weights = np.where(exact.any(axis=1, keepdims=True), exact, weights)
+                predictions[start:stop] = (neighbour_y * weights).sum(axis=1) / weights.sum(axis=1)
+            else:
+                predictions[start:stop] = neighbour_y.mean(axis=1)
+        return predictions
+
+    def _weighted_mean(self, distances, neighbours):
+        """
+        Combines the targets of one query's neighbours, ordered by distance as scikit-learn returns them.
+        """
+        order = np.argsort(distances, kind='stable')
+        distances, neighbour_y = distances[order], self.fit_y[neighbours[order]]
+        if self.weights == 'distance':
+            if (distances == 0).any():
+                return neighbour_y[distances == 0].mean()
+            weights = 1.0 / np.sqrt(distances)
+            return (neighbour_y * weights).sum() / weights.sum()
+        return neighbour_y.mean()
+
+    def encode_row(self, row, out):
+        """
+        Encodes one 7-tuple in prediction feature order into the zeroed vector out. Raises ValueError if a
+        numeric value is NaN or infinite.
+        """
+        for i, position in enumerate(self._numeric_positions):
+            value = float(row[position])
+            if not math.isfinite(value):
+                raise non_finite_error([value])
+            out[i] = (value - self.scaler_mean[i]) / self.scaler_scale[i]
+        for i, position in enumerate(self._categorical_positions):
+            code = self.category_codes[i].get(row[position], -1)
+            if code >= 0:
+                out[self.category_offsets[i] + code] = 1.0
+        return out
+
+    def predict_row(self, row):
+        """
+        Predicts one 7-tuple in prediction feature order without pandas. With the brute backend the query's
+        dot products with the training rows are the numeric part plus one training column per known
+        category, read from the transposed training matrix stored in the artifact (fit_T.npy, mapped like
+        fit_X so that processes share it).
+        """
+        if not self._loaded:
+            self._load()
+        buffers = self._buffers
+        if not hasattr(buffers, 'query'):
+            # Preallocated per thread, reused for every call
+            buffers.query = np.zeros(self.fit_X.shape[1])
+            buffers.dots = np.empty(self.fit_X.shape[0])
+        query = buffers.query
+        with telemetry.stage('encode'):
+            query[:] = 0.0
+            self.encode_row(row, query)
+        k = self.n_neighbors
+        if self.backend != 'brute':
+            with telemetry.stage('neighbour_search'):
+                distances, neighbours = self.search.kneighbors(query[None, :], k)
+            return float(self._weighted_mean(distances[0], neighbours[0]))
+
+        if self._fit_T is None:
+            self._fit_T = np.ascontiguousarray(self.fit_X.T)
+        with telemetry.stage('neighbour_search'):
+            n_numeric = len(self.numeric_columns)
+            dots = np.dot(query[:n_numeric], self._fit_T[:n_numeric], out=buffers.dots)
+            for column in np.flatnonzero(query[n_numeric:]):
+                dots += self._fit_T[n_numeric + column]
+            # Squared distances |q|^2 - 2 q.t + |t|^2, as in squared_distances()
+            distances = dots
+            distances *= -2.0
+            distances += self.fit_sq_norms
+            distances += query @ query
+            np.maximum(distances, 0.0, out=distances)
+            neighbours = np.argpartition(distances, k - 1)[:k]
+        return float(self._weighted_mean(distances[neighbours], neighbours))
+
+    def predict_rows(self, rows):
+        """
+        Predicts a sequence of 7-tuples in prediction feature order, without building a DataFrame.
+        Returns a NumPy array.
+        """
+        if not self._loaded:
+            self._load()
+        if len(rows) <= single_row_limit:
+            return np.array([self.predict_row(row) for row in rows])
+        with telemetry.stage('encode'):
+            encoded = np.zeros((len(rows), self.fit_X.shape[1]))
+            for row, out in zip(rows, encoded):
+                self.encode_row(row, out)
+        return self.predict_encoded(encoded)
+
+    def boundary_ties(self, X):
+        """
+        Returns a boolean array marking rows of X whose k-th nearest distance is shared by more than
+        k training rows (duplicated training points). Which of the tied rows is used, and therefore
+        the prediction, can differ from scikit-learn for those rows.
+        """
+        distances = self.squared_distances(self.encode(X))
+        kth = np.partition(distances, self.n_neighbors - 1, axis=1)[:, self.n_neighbors - 1, None]
+        return (distances <= kth * (1 + 1e-12)).sum(axis=1) > self.n_neighbors
+
+    def predict(self, X):
+        """
+        Predicts the yield for every row of a DataFrame with the prediction feature columns.
+        """
+        return self.predict_encoded(self.encode(X))
+
+
+def compile_model(model, backend='brute'):
+    """
+    Returns a MappedKNNModel built in memory from model if it is a KNN pipeline of the supported shape
+    (see pipeline_arrays()), for its pandas-free predict_rows(); any other model is returned unchanged.
+    """
+    if not hasattr(model, 'named_steps'):
+        return model
+    try:
+        return MappedKNNModel.from_pipeline(model, backend=backend)
+    except (AttributeError, KeyError, IndexError, ValueError):
+        return model
+
+
+def main(argv=None):
+    from yield_model import model_filename, artifact_dirname, load_model, synthetic_frame
+
+    parser = argparse.ArgumentParser(description="Export the KNN pipeline as a memory-mapped artifact")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="export a pickled pipeline")
+    export_parser.add_argument("--model", default=model_filename, help=f"pickled pipeline (default: {model_filename})")
+    export_parser.add_argument("--out", default=artifact_dirname, help=f"output directory (default: {artifact_dirname})")
+    export_parser.add_argument("--verify-rows", type=int, default=10_000,
+                               help="synthetic rows used to check the export against the pickle (default: 10000)")
+    args = parser.parse_args(argv)
+
+    pipeline = load_model(args.model)
+    manifest = export_artifact(pipeline, args.out, source_path=args.model)
+    print(f"Exported {manifest['n_samples']} training rows to '{args.out}'")
+
+    if args.verify_rows > 0:
+        frame = synthetic_frame(args.verify_rows)
+        model = MappedKNNModel(args.out)
+        mismatched = ~np.isclose(model.predict(frame), pipeline.predict(frame))
+        tied = np.zeros(len(frame), dtype=bool)
+        tied[mismatched] = model.boundary_ties(frame[mismatched])
+        errors = int(np.sum(mismatched & ~tied))
+        print(f"Verified {len(frame)} synthetic rows: {int(mismatched.sum())} mismatch(es), "
+              f"{int(tied.sum())} explained by tied duplicate training rows")
+        if errors:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
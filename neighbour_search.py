@@ -0,0 +1,273 @@
+"""
+Neighbour search backends for model_artifact.MappedKNNModel.
+
+Every backend is built from a loaded model and implements kneighbors(encoded, k), returning the squared
+distances and training-row indices of the k nearest neighbours of each encoded query row.
+
+    brute     exact; distances to every training row with one BLAS product per block of queries
+    kdtree    exact; KD-trees over the scaled numeric columns, one per categorical group
+    rpforest  experimental and lossy; forest of random-projection trees over the whole encoded space (pure NumPy)
+
+rpforest can return neighbours other than the exact ones, so its predictions differ from the pipeline's.
+On the exported model it does not pay off: 10 trees of 32-row leaves find 0.60 of the exact neighbours,
+50 trees 0.88 at 0.74 ms/query, and 512-row leaves 0.95 at about 2 ms/query, against about 0.3 ms/query
+for brute force on 500 rows. kdtree is exact and about as fast as brute force on this training set.
+
+Usage (recall-vs-latency report against brute force on synthetic rows):
+    python neighbour_search.py --rows 2000
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+
+class BruteForceSearch:
+    """
+    Exact search computing the distance from each query to every training row.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def kneighbors(self, encoded, k):
+        distances = self.model.squared_distances(encoded)
+        neighbours = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(distances, neighbours, axis=1), neighbours
+
+
+def _category_codes(encoded, model):
+    """
+    Returns the category code of every one-hot block of encoded rows, -1 where the block is all zeros.
+    """
+    codes = np.empty((encoded.shape[0], len(model.categorical_columns)), dtype=np.intp)
+    for i, offset in enumerate(model.category_offsets):
+        block = encoded[:, offset:offset + len(model.category_codes[i])]
+        codes[:, i] = np.where(block.any(axis=1), block.argmax(axis=1), -1)
+    return codes
+
+
+class KDTreeSearch:
+    """
+    Exact search using KD-trees over the scaled numeric columns only.
+
+    The squared distance in the encoded space is the numeric part plus a categorical part that is
+    2 per mismatching known category and 1 per unknown one. Training rows are grouped by the values
+    of every subset of the categorical columns, with one tree per group. If a row with a given set of
+    matching categories is among the k nearest, it is also among the k numerically nearest rows of
+    the group that matches on that set, because every row of that group has at most the same
+    categorical distance. So the k numeric neighbours from each group cover the exact answer:
+    at most 2**3 * k candidates per query.
+    """
+
+    def __init__(self, model, leafsize=16):
+        from scipy.spatial import cKDTree
+
+        self._cKDTree = cKDTree
+        self.leafsize = leafsize
+        self.model = model
+        self.n_numeric = len(model.numeric_columns)
+        fit_X = np.asarray(model.fit_X)
+        self.numeric = np.ascontiguousarray(fit_X[:, :self.n_numeric])
+        self.codes = _category_codes(fit_X, model)
+        # (matched columns, their codes) -> (training row indices, tree over their numeric columns)
+        self._group_trees = {}
+
+    def _group_tree(self, columns, key):
+        group = self._group_trees.get((columns, key))
+        if group is None:
+            rows = np.flatnonzero(np.all(self.codes[:, list(columns)] == key, axis=1))
+            tree = self._cKDTree(self.numeric[rows], leafsize=self.leafsize) if len(rows) else None
+            group = self._group_trees[(columns, key)] = (rows, tree)
+        return group
+
+    def _exact(self, numeric, codes, queries, rows):
+        """
+        Squared distances between pairs of query rows and training rows.
+        """
+        query_codes = codes[queries]
+        distances = np.square(self.numeric[rows] - numeric[queries]).sum(axis=1)
+        distances += 2.0 * ((self.codes[rows] != query_codes) & (query_codes >= 0)).sum(axis=1)
+        distances += (query_codes < 0).sum(axis=1)
+        return distances
+
+    def kneighbors(self, encoded, k):
+        n_queries = len(encoded)
+        numeric = np.ascontiguousarray(encoded[:, :self.n_numeric])
+        codes = _category_codes(encoded, self.model)
+        n_columns = codes.shape[1]
+
+        # Collect the k numeric nearest rows of every group each query belongs to
+        groups = {}
+        for i in range(n_queries):
+            known = [j for j in range(n_columns) if codes[i, j] >= 0]
+            for mask in range(1 << len(known)):
+                columns = tuple(j for bit, j in enumerate(known) if mask >> bit & 1)
+                groups.setdefault((columns, tuple(codes[i, list(columns)])), []).append(i)
+        pair_queries, pair_rows = [], []
+        for (columns, key), members in groups.items():
+            rows, tree = self._group_tree(columns, key)
+            if tree is None:
+                continue
+            _, nearest = tree.query(numeric[members], min(k, len(rows)))
+            nearest = nearest.reshape(len(members), -1)
+            pair_queries.append(np.repeat(members, nearest.shape[1]))
+            pair_rows.append(rows[nearest.reshape(-1)])
+
+        # Deduplicate the (query, row) candidates, rank them exactly and keep the first k per query
+        pairs = np.unique(np.concatenate(pair_queries) * len(self.numeric) + np.concatenate(pair_rows))
+        queries, rows = np.divmod(pairs, len(self.numeric))
+        pair_distances = self._exact(numeric, codes, queries, rows)
+        order = np.lexsort((pair_distances, queries))
+        counts = np.bincount(queries, minlength=n_queries)
+        take = (np.cumsum(counts) - counts)[:, None] + np.arange(k)
+        return pair_distances[order][take], rows[order][take]
+
+
+class RandomProjectionForest:
+    """
+    Approximate search over a forest of random-projection trees (Annoy-style). Experimental and lossy:
+    see the module docstring for its recall on the exported model.
+
+    Each tree splits its rows in half along the direction between two random rows of the node, down to
+    leaf_size rows per leaf. A query visits one leaf per tree and is compared exactly against the union
+    of those leaves, so more trees give higher recall at a higher cost.
+    """
+
+    def __init__(self, model, n_trees=10, leaf_size=32, seed=0):
+        if leaf_size < 2 * model.n_neighbors:
+            raise ValueError("leaf_size must be at least twice the number of neighbours")
+        self.fit_X = np.asarray(model.fit_X)
+        self.fit_sq_norms = np.asarray(model.fit_sq_norms)
+        self.leaf_size = leaf_size
+        rng = np.random.default_rng(seed)
+        self.trees = [self._build_tree(rng) for _ in range(n_trees)]
+
+    def _build_tree(self, rng):
+        """
+        Returns (normals, offsets, children, leaf_rows). children[node] holds the two child ids; a
+        negative id -(j + 1) refers to leaf j, whose training rows are leaf_rows[j].
+        """
+        normals, offsets, children, leaf_rows = [], [], [], []
+
+        def add_leaf(rows):
+            leaf_rows.append(rows)
+            return -len(leaf_rows)
+
+        def split(rows):
+            if len(rows) <= self.leaf_size:
+                return add_leaf(rows)
+            a, b = rng.choice(rows, 2, replace=False)
+            normal = self.fit_X[a] - self.fit_X[b]
+            if not normal.any():
+                normal = rng.standard_normal(self.fit_X.shape[1])
+            projections = self.fit_X[rows] @ normal
+            order = np.argsort(projections, kind='stable')
+            half = len(rows) // 2
+            if projections[order[0]] == projections[order[-1]]:
+                return add_leaf(rows)  # duplicated points cannot be separated
+            node = len(normals)
+            normals.append(normal)
+            offsets.append((projections[order[half - 1]] + projections[order[half]]) / 2)
+            children.append([0, 0])
+            children[node][0] = split(rows[order[:half]])
+            children[node][1] = split(rows[order[half:]])
+            return node
+
+        root = split(np.arange(self.fit_X.shape[0]))
+        if root < 0:
+            # Whole training set fits in one leaf: a single dummy node sends everything to it
+            normals.append(np.zeros(self.fit_X.shape[1]))
+            offsets.append(0.0)
+            children.append([root, root])
+        return np.array(normals), np.array(offsets), np.array(children), leaf_rows
+
+    def _leaves(self, tree, encoded):
+        normals, offsets, children, _ = tree
+        node = np.zeros(len(encoded), dtype=np.intp)
+        active = np.arange(len(encoded))
+        while len(active):
+            current = node[active]
+            right = np.einsum('ij,ij->i', encoded[active], normals[current]) > offsets[current]
+            node[active] = children[current, right.astype(np.intp)]
+            active = active[node[active] >= 0]
+        return -node - 1
+
+    def kneighbors(self, encoded, k):
+        leaves = [self._leaves(tree, encoded) for tree in self.trees]
+        distances = np.full((len(encoded), k), np.inf)
+        neighbours = np.zeros((len(encoded), k), dtype=np.intp)
+        for i in range(len(encoded)):
+            rows = np.unique(np.concatenate([tree[3][leaves[t][i]] for t, tree in enumerate(self.trees)]))
+            row_distances = self.fit_sq_norms[rows] - 2.0 * (self.fit_X[rows] @ encoded[i]) + encoded[i] @ encoded[i]
+            np.maximum(row_distances, 0.0, out=row_distances)
+            best = np.argpartition(row_distances, min(k, len(rows)) - 1)[:k]
+            distances[i, :len(best)] = row_distances[best]
+            neighbours[i, :len(best)] = rows[best]
+        return distances, neighbours
+
+
+backends = {
+    'brute': BruteForceSearch,
+    'kdtree': KDTreeSearch,
+    'rpforest': RandomProjectionForest,
+}
+
+
+def recall_report(model, frame, configurations):
+    """
+    Compares neighbour search configurations against brute force on the rows of frame.
+    configurations is a list of (label, backend name, options). Returns a list of dicts with the build
+    time, per-query latency, recall of the exact neighbour set and the largest prediction difference.
+    """
+    encoded = model.encode(frame)
+    k = model.n_neighbors
+    exact = BruteForceSearch(model)
+    start = time.perf_counter()
+    exact_distances, exact_neighbours = exact.kneighbors(encoded, k)
+    brute_latency = (time.perf_counter() - start) / len(frame)
+    exact_predictions = model.fit_y[exact_neighbours].mean(axis=1)
+    kth = exact_distances.max(axis=1)
+
+    results = [{'backend': 'brute', 'build_s': 0.0, 'latency_ms': brute_latency * 1e3,
+                'recall': 1.0, 'max_abs_diff': 0.0}]
+    for label, name, options in configurations:
+        start = time.perf_counter()
+        search = backends[name](model, **options)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        distances, neighbours = search.kneighbors(encoded, k)
+        latency = (time.perf_counter() - start) / len(frame)
+        # A neighbour counts as found if it is within the exact k-th distance (ties are interchangeable)
+        recall = np.mean(distances <= kth[:, None] * (1 + 1e-9))
+        predictions = model.fit_y[neighbours].mean(axis=1)
+        results.append({'backend': label, 'build_s': build_time, 'latency_ms': latency * 1e3,
+                        'recall': float(recall), 'max_abs_diff': float(np.max(np.abs(predictions - exact_predictions)))})
+    return results
+
+
+def main(argv=None):
+    from yield_model import artifact_dirname, load_model, synthetic_frame
+
+    parser = argparse.ArgumentParser(description="Neighbour search recall-vs-latency report")
+    parser.add_argument("--model", default=artifact_dirname,
+                        help=f"exported model artifact directory (default: {artifact_dirname})")
+    parser.add_argument("--rows", type=int, default=2000, help="number of synthetic query rows")
+    args = parser.parse_args(argv)
+
+    model = load_model(args.model)
+    frame = synthetic_frame(args.rows, seed=1)
+    configurations = [('kdtree', 'kdtree', {})]
+    configurations += [(f'rpforest({n} trees)', 'rpforest', {'n_trees': n}) for n in (5, 10, 25, 50)]
+    configurations += [(f'rpforest(10x{size} leaf)', 'rpforest', {'leaf_size': size}) for size in (128, 512)]
+
+    print(f"{'backend':<22} {'build s':>8} {'ms/query':>9} {'recall':>7} {'max |diff|':>11}")
+    for result in recall_report(model, frame, configurations):
+        print(f"{result['backend']:<22} {result['build_s']:>8.2f} {result['latency_ms']:>9.3f} "
+              f"{result['recall']:>7.3f} {result['max_abs_diff']:>11.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Multi-process scoring for the crop yield model.
+
+KNN prediction is CPU-bound, so a single Python process only keeps one core busy. ShardedScorer keeps a
+pool of worker processes that each hold one copy of the model (inherited copy-on-write from the parent
+when the 'fork' start method is available, otherwise loaded once per worker), splits query batches
+into shards across the pool and returns the predictions in input order. Each worker gets an equal
+share of scikit-learn's distance-computation working memory so that the pool as a whole stays within
+the single-process memory budget.
+
+Usage (scaling report on synthetic rows):
+    python parallel_predict.py --rows 200000 --workers 1 2 4 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from yield_model import add_model_arguments, load_model, synthetic_frame
+
+# Total scikit-learn working memory (MiB) shared by all workers of a pool
+default_working_memory = 1024
+
+# Model used inside each worker process
+_worker_model = None
+
+
+def _init_worker(model_path, backend, working_memory):
+    """
+    Pool initializer: loads the model unless it was inherited from the parent, caps the memory used
+    for distance chunks of a scikit-learn pipeline and pins BLAS/OpenMP to one thread so that workers
+    do not oversubscribe the cores. A worker scoring an exported artifact does not import scikit-learn.
+    """
+    global _worker_model
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    if _worker_model is None:
+        _worker_model = load_model(model_path, backend)
+    if hasattr(_worker_model, 'named_steps'):
+        import sklearn
+        sklearn.set_config(working_memory=working_memory)
+
+
+def _predict_shard(frame):
+    return _worker_model.predict(frame)
+
+
+class ShardedScorer:
+    """
+    Scores DataFrames with a pool of worker processes, returning results in input order.
+    """
+
+    def __init__(self, model_path=None, workers=None, model=None, working_memory=default_working_memory,
+                 backend=None):
+        self.model_path = model_path
+        self.workers = workers or os.cpu_count() or 1
+
+        global _worker_model
+        context = multiprocessing.get_context()
+        if context.get_start_method() == 'fork':
+            # Load once in the parent so that every forked worker shares the training matrix pages
+            _worker_model = model if model is not None else load_model(model_path, backend)
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_init_worker,
+                                         initargs=(model_path, backend, max(1, working_memory // self.workers)))
+
+    def predict(self, frame, shard_size=None):
+        """
+        Predicts every row of frame, split into shards of at most shard_size rows (by default one
+        shard per worker). Returns a NumPy array in the same order as frame.
+        """
+        if len(frame) == 0:
+            return np.empty(0)
+        if shard_size is None:
+            shard_size = -(-len(frame) // self.workers)
+        shards = [frame.iloc[i:i + shard_size] for i in range(0, len(frame), shard_size)]
+        return np.concatenate(list(self._pool.map(_predict_shard, shards)))
+
+    def imap(self, chunks, max_pending=None):
+        """
+        Lazily predicts an iterable of DataFrames, yielding one prediction array per chunk in input
+        order. At most max_pending chunks (default: twice the worker count) are in flight at a time,
+        so memory stays bounded even for unbounded inputs.
+        """
+        max_pending = max_pending or 2 * self.workers
+        pending = deque()
+        for chunk in chunks:
+            pending.append(self._pool.submit(_predict_shard, chunk))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def measure_scaling(frame, worker_counts, model_path=None):
+    """
+    Measures rows/sec for an in-process baseline and for each worker count.
+    Returns a list of (workers, rows_per_sec, speedup) tuples, with workers=0 for the baseline.
+    """
+    model = load_model(model_path)
+    start = time.perf_counter()
+    baseline = model.predict(frame)
+    baseline_rate = len(frame) / (time.perf_counter() - start)
+    results = [(0, baseline_rate, 1.0)]
+
+    for workers in worker_counts:
+        with ShardedScorer(model_path, workers=workers, model=model) as scorer:
+            scorer.predict(frame.iloc[:workers])  # warm up the workers
+            start = time.perf_counter()
+            predictions = scorer.predict(frame)
+            rate = len(frame) / (time.perf_counter() - start)
+        if not np.allclose(predictions, baseline):
+            raise RuntimeError(f"Predictions with {workers} workers differ from the single-process baseline")
+        results.append((workers, rate, rate / baseline_rate))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report multi-process scoring throughput")
+    add_model_arguments(parser, backend=False)
+    parser.add_argument("--rows", type=int, default=100_000, help="number of synthetic rows to score")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1],
+                        help="worker counts to measure")
+    args = parser.parse_args(argv)
+
+    frame = synthetic_frame(args.rows)
+    print(f"{'workers':>8} {'rows/sec':>12} {'speedup':>8}")
+    for workers, rate, speedup in measure_scaling(frame, args.workers, args.model):
+        label = 'baseline' if workers == 0 else str(workers)
+        print(f"{label:>8} {rate:>12,.0f} {speedup:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Bounded LRU/TTL memoization in front of the model's predict().
+
+Predictions are keyed on the normalized 7-feature input tuple. The cache remembers a hash of the
+model file (or artifact directory) it was filled from: when the file changes on disk the entries are
+dropped and the model is reloaded. Hit, miss, eviction and expiry counters are kept for sizing.
+
+Misses are predicted with the model's predict_rows() if it has one (see model_artifact.compile_model()),
+which takes the 7-tuples directly, else with predict() on a DataFrame.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from telemetry import telemetry
+from yield_model import default_model_path, prediction_features, load_model
+
+default_maxsize = 4096
+
+
+def _model_files(path):
+    if os.path.isdir(path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    return [path]
+
+
+def model_signature(path):
+    """
+    Returns a cheap (name, size, mtime) signature of the model file(s), used to detect changes.
+    """
+    return tuple((name, os.path.getsize(name), os.path.getmtime(name)) for name in _model_files(path))
+
+
+def model_hash(path):
+    """
+    Returns the SHA-256 of the model file, or of all files of an artifact directory.
+    """
+    digest = hashlib.sha256()
+    for name in _model_files(path):
+        digest.update(os.path.basename(name).encode())
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_row(row):
+    """
+    Returns the cache key for one (Crop, Crop_Year, Season, State, Annual_Rainfall, Fertilizer,
+    Pesticide) row, so that e.g. 2020, 2020.0 and numpy.int64(2020) share an entry.
+    """
+    crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide = row
+    return (str(crop), int(crop_year), str(season), str(state),
+            float(annual_rainfall), float(fertilizer), float(pesticide))
+
+
+def predict_model_rows(model, rows):
+    """
+    Predicts a list of 7-tuples with model.predict_rows() if the model has it, else through a DataFrame.
+    """
+    with telemetry.stage('model_predict'):
+        if hasattr(model, 'predict_rows'):
+            return model.predict_rows(rows)
+        import pandas as pd
+
+        with telemetry.stage('dataframe_build'):
+            frame = pd.DataFrame(rows, columns=prediction_features)
+        return model.predict(frame)
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of model predictions with an optional time-to-live (in seconds).
+
+    predict() takes the same DataFrame the model does; predict_rows() takes plain 7-tuples and only
+    builds a DataFrame for the rows that miss. If model_path is given, the cache checks it before each
+    lookup and reloads the model when its contents change.
+    """
+
+    def __init__(self, model, model_path=None, maxsize=default_maxsize, ttl=None, loader=load_model):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.model = model
+        self.model_path = model_path
+        self.loader = loader
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # The hash is computed on the first lookup rather than here to keep startup cheap
+        self._signature = None
+        self.model_hash = None
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def _check_model(self):
+        """
+        Drops every entry and reloads the model if the model file has changed since the last check. The
+        new signature is only recorded once the reload has succeeded, so a reload that fails (e.g. on a
+        half-written file) raises again on the next lookup instead of leaving the old model in place.
+        """
+        if self.model_path is None:
+            return
+        signature = model_signature(self.model_path)
+        if signature == self._signature:
+            return
+        new_hash = model_hash(self.model_path)
+        if self.model_hash is not None and new_hash != self.model_hash:
+            self.model = self.loader(self.model_path)
+            self._entries.clear()
+            self.invalidations += 1
+        self._signature = signature
+        self.model_hash = new_hash
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if self.ttl is not None and now - stored_at > self.ttl:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, now):
+        self._entries[key] = (value, now)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def predict_rows(self, rows):
+        """
+        Returns the predictions for a sequence of 7-tuples as a NumPy array, computing all misses with
+        one model call.
+        """
+        keys = [normalize_row(row) for row in rows]
+        predictions = np.empty(len(keys))
+        with self._lock:
+            self._check_model()
+            model = self.model
+            # Misses predicted by a model that was replaced meanwhile are returned but not stored
+            generation = self.invalidations
+            now = time.monotonic()
+            missing = {}
+            for i, key in enumerate(keys):
+                value = self._get(key, now)
+                if value is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    predictions[i] = value
+            # Counted per row, like hits: a row repeated within the batch is a miss each time
+            misses = sum(len(positions) for positions in missing.values())
+            hits = len(keys) - misses
+            self.hits += hits
+            self.misses += misses
+        telemetry.count('cache_hits', hits)
+        telemetry.count('cache_misses', misses)
+
+        if missing:
+            # Predict outside the lock so that concurrent callers are not serialized on the model
+            missing_keys = list(missing)
+            values = predict_model_rows(model, missing_keys)
+            with self._lock:
+                now = time.monotonic()
+                current = self.invalidations == generation
+                for key, value in zip(missing_keys, values):
+                    predictions[missing[key]] = value
+                    if current:
+                        self._put(key, float(value), now)
+        return predictions
+
+    def predict(self, X):
+        """
+        Drop-in replacement for model.predict() on a DataFrame with the prediction feature columns.
+        """
+        return self.predict_rows(list(X[prediction_features].itertuples(index=False, name=None)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters and current size as a dict.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+def load_compiled_model(model_path):
+    """
+    load_model() followed by model_artifact.compile_model(), so that a pickled KNN pipeline gets the
+    pandas-free single-row path.
+    """
+    from model_artifact import compile_model
+
+    return compile_model(load_model(model_path))
+
+
+def load_cached_model(model_path=None, **options):
+    """
+    Loads the model at model_path (default: default_model_path()) behind a PredictionCache that watches
+    it for changes, compiling a pickled KNN pipeline (see load_compiled_model()). options are passed to
+    PredictionCache.
+    """
+    if model_path is None:
+        model_path = default_model_path()
+    return PredictionCache(load_compiled_model(model_path), model_path=model_path, loader=load_compiled_model,
+                           **options)
+
+
+def load_prediction_model():
+    """
+    Loads the apps' model, reporting which: run in the background by crop.py and dashboard.py once
+    their window is up.
+    """
+    # Prefer the memory-mapped export (opened lazily on first predict) over the pickle;
+    # set CROP_YIELD_MODEL to use another model, e.g. CROP_YIELD_MODEL=crop_yield_model.h5
+    model_path = default_model_path()
+    print(f"Loading model from '{model_path}'...")
+    # Memoize predictions so that repeated clicks with the same inputs skip the model
+    return load_cached_model(model_path)
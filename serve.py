@@ -0,0 +1,437 @@
+"""
+Local HTTP prediction service (asyncio, standard library only).
+
+Endpoints (JSON in, JSON out):
+    POST /predict   one record {"Crop": ..., "Crop_Year": ..., ...} -> {"prediction": y}
+                    or a list of records                           -> {"predictions": [y, ...]}
+    POST /trend     one record, optional "horizon" (years)         -> {"years": [...], "yields": [...]}
+    GET  /metrics   request count, p50/p99 latency, throughput over the last 10 s and batching statistics
+    GET  /health    {"status": "ok"}
+    GET  /telemetry per-stage histograms and counters (see telemetry.py) in Prometheus text format,
+                    or as JSON lines with ?format=jsonl; empty unless started with --telemetry
+    POST /profile   runs the sampling profiler for {"seconds": n} (default 5) while serving and returns
+                    {"samples": ..., "top": [[function, samples], ...], "collapsed": "..."}
+
+Records are validated against yield_model.prediction_features. Requests arriving within --window-ms of
+each other are coalesced by MicroBatcher into a single vectorized model call.
+
+Usage:
+    python serve.py --port 8000
+    python loadgen.py --port 8000
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+
+from telemetry import telemetry
+from yield_model import prediction_features, numeric_features, trend_horizon, trend_rows
+
+default_port = 8000
+# How long the batcher waits for more requests after the first one of a batch
+default_window_ms = 2.0
+default_max_batch = 4096
+max_body_bytes = 1 << 20
+max_horizon = 100
+# Longest sampling profile POST /profile may ask for
+max_profile_seconds = 60
+# Number of recent request latencies kept for the percentiles
+latency_window = 10000
+# Seconds of recent requests over which the throughput is computed
+throughput_window = 10.0
+
+status_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                  413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Validation ---
+
+def parse_record(record):
+    """
+    Returns the 7-tuple (in prediction_features order) for one JSON record. Raises RequestError (400) if
+    a feature is missing, unknown or of the wrong type.
+    """
+    if not isinstance(record, dict):
+        raise RequestError(400, "Each record must be a JSON object")
+    missing = [name for name in prediction_features if name not in record]
+    if missing:
+        raise RequestError(400, f"Record is missing required field(s): {', '.join(missing)}")
+    unknown = [name for name in record if name not in prediction_features]
+    if unknown:
+        raise RequestError(400, f"Record has unknown field(s): {', '.join(unknown)}")
+    row = []
+    for name in prediction_features:
+        value = record[name]
+        if name in numeric_features:
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                raise RequestError(400, f"Field '{name}' must be a finite number")
+            if name == 'Crop_Year':
+                if value != int(value):
+                    raise RequestError(400, "Field 'Crop_Year' must be a whole year")
+                value = int(value)
+            else:
+                value = float(value)
+        elif not isinstance(value, str):
+            raise RequestError(400, f"Field '{name}' must be a string")
+        row.append(value)
+    return tuple(row)
+
+
+def parse_horizon(payload):
+    horizon = payload.pop('horizon', trend_horizon) if isinstance(payload, dict) else trend_horizon
+    if isinstance(horizon, bool) or not isinstance(horizon, int) or not 1 <= horizon <= max_horizon:
+        raise RequestError(400, f"'horizon' must be an integer between 1 and {max_horizon}")
+    return horizon
+
+
+# --- Micro-batching ---
+
+class MicroBatcher:
+    """
+    Coalesces the rows of concurrent requests into one call of predict_rows, which runs in the default
+    executor so the event loop keeps accepting requests. After the first request of a batch arrives the
+    batcher waits window seconds for others, up to max_batch rows; requests that arrive while a batch is
+    being computed form the next one. If a batch of several requests fails, each request is retried on its
+    own, so only the ones that fail by themselves get the error.
+    """
+
+    def __init__(self, predict_rows, window=default_window_ms / 1e3, max_batch=default_max_batch):
+        self.predict_rows = predict_rows
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = self.batched_rows = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, rows):
+        """
+        Returns the predictions for rows (a list of 7-tuples) as a list of floats.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            if self.window > 0 and size < self.max_batch:
+                await asyncio.sleep(self.window)
+            while size < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                size += len(batch[-1][0])
+
+            rows = [row for request_rows, _, _ in batch for row in request_rows]
+            if telemetry.enabled:
+                now = time.perf_counter()
+                for _, _, queued in batch:
+                    telemetry.record('batch_wait', now - queued)
+            try:
+                with telemetry.stage('model_call'):
+                    predictions = await loop.run_in_executor(None, self.predict_rows, rows)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                else:
+                    await self._run_separately(batch)
+                continue
+            self.batches += 1
+            self.batched_rows += len(rows)
+            predictions = [float(value) for value in predictions]
+            start = 0
+            for request_rows, future, _ in batch:
+                if not future.done():  # the client may have gone away
+                    future.set_result(predictions[start:start + len(request_rows)])
+                start += len(request_rows)
+
+    async def _run_separately(self, batch):
+        """
+        Predicts each request of a failed batch with a model call of its own.
+        """
+        loop = asyncio.get_running_loop()
+        telemetry.count('batch_retries')
+        for request_rows, future, _ in batch:
+            if future.done():
+                continue
+            try:
+                with telemetry.stage('model_call'):
+                    predictions = await loop.run_in_executor(None, self.predict_rows, request_rows)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.batched_rows += len(request_rows)
+            if not future.done():
+                future.set_result([float(value) for value in predictions])
+
+
+# --- Metrics ---
+
+class ServiceMetrics:
+    """
+    Request counters, a window of recent request latencies (seconds) and the (time, rows) of the requests
+    of the last throughput_window seconds, over which throughput is reported.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = self.errors = self.rows = 0
+        self.latencies = deque(maxlen=latency_window)
+        self.recent = deque()
+
+    def record(self, latency, rows, ok):
+        self.requests += 1
+        self.rows += rows
+        if not ok:
+            self.errors += 1
+        self.latencies.append(latency)
+        now = time.monotonic()
+        self.recent.append((now, rows))
+        self._expire(now)
+
+    def _expire(self, now):
+        while self.recent and self.recent[0][0] < now - throughput_window:
+            self.recent.popleft()
+
+    def throughput(self):
+        """
+        Returns (requests/s, rows/s) over the recent requests, from the first of them until now.
+        """
+        now = time.monotonic()
+        self._expire(now)
+        if not self.recent:
+            return 0.0, 0.0
+        # Measured from the completion of the first request, which the span does not cover
+        span = now - self.recent[0][0]
+        if span <= 0:
+            return 0.0, 0.0
+        return (len(self.recent) - 1) / span, sum(rows for _, rows in list(self.recent)[1:]) / span
+
+    def snapshot(self, batcher):
+        ordered = sorted(self.latencies)
+
+        def percentile(q):
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3 if ordered else 0.0
+
+        uptime = time.monotonic() - self.started
+        requests_per_s, rows_per_s = self.throughput()
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'rows': self.rows,
+            'uptime_s': uptime,
+            'throughput_rps': requests_per_s,
+            'rows_per_s': rows_per_s,
+            'latency_p50_ms': percentile(0.50),
+            'latency_p99_ms': percentile(0.99),
+            'batches': batcher.batches,
+            'mean_batch_rows': batcher.batched_rows / batcher.batches if batcher.batches else 0.0,
+        }
+
+
+# --- HTTP ---
+
+class PredictionService:
+    def __init__(self, predict_rows, window=default_window_ms / 1e3, max_batch=default_max_batch):
+        self.batcher = MicroBatcher(predict_rows, window=window, max_batch=max_batch)
+        self.metrics = ServiceMetrics()
+
+    async def handle(self, method, path, body, query=''):
+        """
+        Returns (status, response, number of predicted rows) for one request. The response is sent as
+        JSON, or as plain text if it is a string.
+        """
+        if path == '/health':
+            return 200, {'status': 'ok'}, 0
+        if path == '/metrics':
+            return 200, self.metrics.snapshot(self.batcher), 0
+        if path == '/telemetry':
+            return 200, telemetry.json_lines() if 'format=jsonl' in query else telemetry.prometheus_text(), 0
+        if path not in ('/predict', '/trend', '/profile'):
+            raise RequestError(404, f"No endpoint {path}")
+        if method != 'POST':
+            raise RequestError(405, f"{path} only accepts POST")
+        try:
+            payload = json.loads(body) if body or path != '/profile' else {}
+        except ValueError:
+            raise RequestError(400, "Body is not valid JSON")
+
+        if path == '/profile':
+            return 200, await self.profile(payload), 0
+
+        if path == '/trend':
+            horizon = parse_horizon(payload)
+            rows = trend_rows(parse_record(payload), horizon)
+            yields = await self.batcher.predict(rows)
+            return 200, {'years': [row[1] for row in rows], 'yields': yields}, len(rows)
+        if isinstance(payload, list):
+            if not payload:
+                raise RequestError(400, "Empty list of records")
+            predictions = await self.batcher.predict([parse_record(record) for record in payload])
+            return 200, {'predictions': predictions}, len(payload)
+        predictions = await self.batcher.predict([parse_record(payload)])
+        return 200, {'prediction': predictions[0]}, 1
+
+    async def profile(self, payload):
+        seconds = payload.get('seconds', 5) if isinstance(payload, dict) else None
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)) or not 0 < seconds <= max_profile_seconds:
+            raise RequestError(400, f"'seconds' must be a number between 0 and {max_profile_seconds}")
+        if telemetry.profiler is not None:
+            raise RequestError(400, "A profile is already running")
+        profiler = telemetry.start_profiler()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            telemetry.stop_profiler()
+        return {'samples': profiler.samples, 'top': profiler.top(), 'collapsed': profiler.collapsed()}
+
+    async def serve_connection(self, reader, writer):
+        """
+        Serves HTTP/1.1 requests on one connection until the client closes it (keep-alive supported).
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                started = time.perf_counter()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                rows, path = 0, None
+                try:
+                    try:
+                        method, target, _ = request_line.decode('latin-1').split()
+                        length = int(headers.get('content-length', 0))
+                    except ValueError:
+                        keep_alive = False
+                        raise RequestError(400, "Malformed HTTP request")
+                    path, _, query = target.partition('?')
+                    if length > max_body_bytes:
+                        keep_alive = False
+                        raise RequestError(413, f"Body larger than {max_body_bytes} bytes")
+                    body = await reader.readexactly(length) if length else b''
+                    status, response, rows = await self.handle(method, path, body, query)
+                except RequestError as e:
+                    status, response = e.status, {'error': str(e)}
+                except asyncio.IncompleteReadError:
+                    break
+                except Exception as e:
+                    status, response = 500, {'error': f"Prediction failed: {e}"}
+
+                if isinstance(response, str):
+                    data, content_type = response.encode(), 'text/plain; version=0.0.4'
+                else:
+                    data, content_type = json.dumps(response).encode(), 'application/json'
+                writer.write(f"HTTP/1.1 {status} {status_reasons[status]}\r\n"
+                             f"Content-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                # /metrics and /health polls are not counted
+                if path in ('/predict', '/trend'):
+                    latency = time.perf_counter() - started
+                    self.metrics.record(latency, rows, status == 200)
+                    telemetry.record('request', latency)
+                    telemetry.count('requests')
+                    if status != 200:
+                        telemetry.count('request_errors')
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_server(service, host, port, ready=None):
+    service.batcher.start()
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    print(f"Serving predictions on http://{host}:{port} (batch window {service.batcher.window * 1e3:g} ms)",
+          file=sys.stderr)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.batcher.stop()
+
+
+def main(argv=None):
+    from prediction_cache import PredictionCache, load_compiled_model, predict_model_rows
+    from yield_model import add_model_arguments, default_model_path, load_model
+
+    parser = argparse.ArgumentParser(description="Local HTTP crop yield prediction service")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=default_port, help=f"port to listen on (default: {default_port})")
+    add_model_arguments(parser)
+    parser.add_argument("--window-ms", type=float, default=default_window_ms,
+                        help=f"how long to wait for concurrent requests to batch together (default: {default_window_ms})")
+    parser.add_argument("--max-batch", type=int, default=default_max_batch,
+                        help=f"largest number of rows per model call (default: {default_max_batch})")
+    parser.add_argument("--no-cache", action="store_true", help="do not memoize predictions")
+    parser.add_argument("--telemetry", nargs="?", const="", metavar="PATH",
+                        help="time the request stages (served on /telemetry) and, on exit, print a summary or write them to PATH (.prom or .jsonl)")
+    args = parser.parse_args(argv)
+    if args.telemetry is not None:
+        telemetry.enable(path=args.telemetry)
+
+    model_path = args.model or default_model_path()
+    if args.backend:
+        def loader(path):
+            return load_model(path, backend=args.backend)
+    else:
+        # A pickled KNN pipeline gets the pandas-free path of model_artifact.compile_model()
+        loader = load_compiled_model
+    try:
+        model = loader(model_path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    if args.no_cache:
+        def predict_rows(rows):
+            return predict_model_rows(model, rows)
+    else:
+        predict_rows = PredictionCache(model, model_path=model_path, loader=loader).predict_rows
+
+    service = PredictionService(predict_rows, window=args.window_ms / 1e3, max_batch=args.max_batch)
+    try:
+        asyncio.run(run_server(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print(f"Service metrics: {json.dumps(service.metrics.snapshot(service.batcher))}", file=sys.stderr)
+    telemetry.dump()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
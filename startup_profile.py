@@ -0,0 +1,90 @@
+"""
+Import-time profile of the apps' startup.
+
+Runs the startup phases of crop.py or dashboard.py in a fresh interpreter under python -X importtime and
+reports, per phase, the wall time and the top-level packages whose modules took the most time to import
+(self time, i.e. excluding the modules they import in turn, summed over each package):
+
+    window    importing the app module, i.e. everything needed before the window can be built
+    model     loading the model behind the prediction cache (in the background in the app)
+    plotting  importing matplotlib and the Tk canvas (dashboard only, in the background in the app)
+
+Usage:
+    python startup_profile.py dashboard
+    python dashboard.py --profile-imports
+"""
+import argparse
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+phase_marker = '@@phase'
+
+app_phases = {
+    'crop': [
+        ('window', 'import crop'),
+        ('model', 'import prediction_cache; prediction_cache.load_prediction_model()'),
+    ],
+    'dashboard': [
+        ('window', 'import dashboard'),
+        ('model', 'import prediction_cache; prediction_cache.load_prediction_model()'),
+        ('plotting', 'dashboard.load_plotting()'),
+    ],
+}
+
+_importtime_line = re.compile(r'import time:\s+(\d+) \|\s+\d+ \| *(\S+)')
+
+
+def profile_phases(phases):
+    """
+    Runs the (name, statement) phases in order in one child interpreter under -X importtime. Returns a
+    list of (name, wall seconds, {top-level package: import microseconds}) per phase.
+    """
+    lines = ['import sys, time']
+    for name, statement in phases:
+        lines += ['started = time.perf_counter()', statement,
+                  f"sys.stderr.write('{phase_marker} {name} %f\\n' % (time.perf_counter() - started))"]
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', '\n'.join(lines)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Profiled startup failed:\n{result.stderr[-2000:]}")
+
+    profile = []
+    packages = defaultdict(int)
+    for line in result.stderr.splitlines():
+        if line.startswith(phase_marker):
+            _, name, seconds = line.split()
+            profile.append((name, float(seconds), dict(packages)))
+            packages.clear()
+            continue
+        match = _importtime_line.match(line)
+        if match:
+            # Self time of every module, summed by top-level package: where the time is actually spent
+            packages[match.group(2).split('.')[0]] += int(match.group(1))
+    return profile
+
+
+def report(app, top=10):
+    print(f"Startup profile of {app}.py (python -X importtime)")
+    for name, seconds, packages in profile_phases(app_phases[app]):
+        print(f"\n{name:<10} {seconds * 1e3:8.0f} ms wall, {sum(packages.values()) / 1e3:8.0f} ms in imports")
+        for package, microseconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+            print(f"    {package:<28} {microseconds / 1e3:8.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time profile of the apps' startup")
+    parser.add_argument("app", choices=sorted(app_phases), help="app to profile")
+    parser.add_argument("--top", type=int, default=10, help="packages listed per phase (default: 10)")
+    args = parser.parse_args(argv)
+    try:
+        report(args.app, args.top)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
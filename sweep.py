@@ -0,0 +1,329 @@
+"""
+Scenario sweeps: yield surfaces over grids of prediction inputs.
+
+A Sweep holds a base row and the columns swept over lists of values, e.g. Fertilizer x Annual_Rainfall x
+Pesticide for one crop, season and state, or State x Annual_Rainfall x Fertilizer for one crop. The whole
+grid is one array of axis indices in C order; SweepEngine.run() materializes it chunk_rows points at a
+time as column arrays, scores each chunk with one vectorized model call (or across the worker processes
+of a parallel_predict.ShardedScorer) and writes the predictions into a SweepResult as they arrive, so a
+viewer can show the partial surface while the rest is computed.
+
+The engine remembers up to memo_size predictions keyed on the normalized 7-tuple of each point (as in
+prediction_cache.py), so points shared by several sweeps are not predicted again: a repeated sweep, the
+same grid for another base state when State is swept, or the levels two grids have in common. The keys
+of a sweep share their value objects, so an entry costs about 200 bytes and the default memo_size about
+20 MB. Points are evicted least recently used first, and the memo is dropped when the engine is handed
+another model.
+
+Usage (times a sweep, then the same sweep again from the memo):
+    python sweep.py --crop Rice --season Kharif --state Assam --year 2020 --levels 30
+    python sweep.py --crop Rice --all-states --levels 30 --workers 4
+"""
+import argparse
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from prediction_cache import normalize_row
+from telemetry import telemetry
+from yield_model import prediction_features, numeric_features, state_options
+
+# Grid points materialized and scored per model call
+default_chunk_rows = 2048
+
+# Predictions remembered across sweeps (about 200 bytes each)
+default_memo_size = 100_000
+
+# Grid levels per numeric axis
+default_levels = 30
+
+
+def _axis_values(column, values):
+    """
+    Returns the values of one swept column as an array of the type normalize_row() gives it.
+    """
+    if column == 'Crop_Year':
+        return np.asarray(values, dtype=np.int64)
+    if column in numeric_features:
+        return np.asarray(values, dtype=np.float64)
+    return np.asarray([str(value) for value in values])
+
+
+class Sweep:
+    """
+    A grid of prediction inputs: base (a 7-tuple in prediction_features order) with every column of axes,
+    a list of (column, values), replaced by each of its values in turn. Grid points are numbered in C
+    order, so the predictions reshape to shape, one dimension per axis.
+    """
+
+    def __init__(self, base, axes):
+        if not axes:
+            raise ValueError("A sweep needs at least one axis")
+        columns = [column for column, _ in axes]
+        unknown = [column for column in columns if column not in prediction_features]
+        if unknown:
+            raise ValueError(f"Unknown sweep column(s): {', '.join(unknown)}")
+        if len(set(columns)) != len(columns):
+            raise ValueError("Each column can only be swept once")
+        self.base = normalize_row(base)
+        self.axes = [(column, _axis_values(column, values)) for column, values in axes]
+        if any(len(values) == 0 for _, values in self.axes):
+            raise ValueError("Every sweep axis needs at least one value")
+        self.shape = tuple(len(values) for _, values in self.axes)
+        self.size = int(np.prod(self.shape))
+        # The whole grid as one array: the axis indices of every point, one column per axis
+        self.grid = np.indices(self.shape, dtype=np.int32).reshape(len(self.shape), -1).T
+        # The levels of each axis as Python objects, shared by all the memo keys of the sweep
+        self._levels = [values.tolist() for _, values in self.axes]
+        self._positions = [prediction_features.index(column) for column, _ in self.axes]
+
+    def columns(self, start, stop):
+        """
+        Returns {column: array} holding the inputs of grid points start to stop.
+        """
+        count = stop - start
+        columns = {name: np.full(count, value) for name, value in zip(prediction_features, self.base)}
+        for axis, (column, values) in enumerate(self.axes):
+            columns[column] = values[self.grid[start:stop, axis]]
+        return columns
+
+    def keys(self, start, stop):
+        """
+        Returns the normalized 7-tuples (see prediction_cache.normalize_row()) of grid points start to stop.
+        """
+        columns = [[value] * (stop - start) for value in self.base]
+        for axis, (levels, position) in enumerate(zip(self._levels, self._positions)):
+            columns[position] = [levels[i] for i in self.grid[start:stop, axis].tolist()]
+        return list(zip(*columns))
+
+
+class SweepResult:
+    """
+    Predictions of a sweep, filled in as chunks complete: values (shape sweep.shape) is NaN where nothing
+    has been predicted yet. done counts the finished points and memo_hits those answered from the memo.
+    Another thread may read it while the engine runs; cancel() stops the engine after the current chunk.
+    """
+
+    def __init__(self, sweep):
+        self.sweep = sweep
+        self.values = np.full(sweep.shape, np.nan)
+        self.done = self.memo_hits = 0
+        self.elapsed = 0.0
+        self.cancelled = False
+
+    @property
+    def finished(self):
+        return self.done == self.sweep.size
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SweepEngine:
+    """
+    Scores sweeps against model in chunks of chunk_rows points, with an optional ShardedScorer to spread
+    the chunks over worker processes, remembering up to memo_size predictions across sweeps.
+    """
+
+    def __init__(self, model, scorer=None, chunk_rows=default_chunk_rows, memo_size=default_memo_size):
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be at least 1")
+        self.model = model
+        self.scorer = scorer
+        self.chunk_rows = chunk_rows
+        self.memo_size = memo_size
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self.predicted = self.memo_hits = 0
+
+    def set_model(self, model):
+        """
+        Switches to another model (e.g. after the model file was reloaded), dropping the memo.
+        """
+        with self._lock:
+            if model is not self.model:
+                self.model = model
+                self._memo.clear()
+
+    def _lookup(self, keys):
+        values = np.empty(len(keys))
+        with self._lock:
+            for i, key in enumerate(keys):
+                value = self._memo.get(key)
+                if value is None:
+                    values[i] = np.nan
+                else:
+                    self._memo.move_to_end(key)
+                    values[i] = value
+        return values
+
+    def _remember(self, keys, values):
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._memo[key] = value
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def _chunks(self, sweep, result):
+        """
+        Yields (start, stop, keys, values, missing positions, missing rows as a DataFrame or None) for each
+        chunk of the grid, with the memoized points already filled in.
+        """
+        import pandas as pd
+
+        for start in range(0, sweep.size, self.chunk_rows):
+            if result.cancelled:
+                return
+            stop = min(start + self.chunk_rows, sweep.size)
+            keys = sweep.keys(start, stop)
+            values = self._lookup(keys)
+            missing = np.flatnonzero(np.isnan(values))
+            frame = None
+            if len(missing):
+                columns = sweep.columns(start, stop)
+                with telemetry.stage('dataframe_build'):
+                    frame = pd.DataFrame({name: column[missing] for name, column in columns.items()},
+                                         columns=prediction_features)
+            yield start, stop, keys, values, missing, frame
+
+    def _store(self, result, chunk, predictions=None):
+        start, stop, keys, values, missing, _ = chunk
+        if predictions is not None:
+            values[missing] = predictions
+            self._remember([keys[i] for i in missing], values[missing].tolist())
+        result.values.reshape(-1)[start:stop] = values
+        result.memo_hits += (stop - start) - len(missing)
+        result.done += stop - start
+
+    def run(self, sweep, result=None):
+        """
+        Predicts every point of sweep into result (a new SweepResult by default), chunk by chunk, and
+        returns it. Stops early if result.cancel() is called.
+        """
+        if result is None:
+            result = SweepResult(sweep)
+        started = time.perf_counter()
+        model = self.model
+        if self.scorer is None:
+            for chunk in self._chunks(sweep, result):
+                frame = chunk[-1]
+                predictions = None
+                if frame is not None:
+                    with telemetry.stage('sweep_chunk'):
+                        predictions = model.predict(frame)
+                self._store(result, chunk, predictions)
+                result.elapsed = time.perf_counter() - started
+        else:
+            # Chunks whose points are all memoized are not sent to the workers, but still reported in order
+            queued = deque()
+
+            def frames():
+                for chunk in self._chunks(sweep, result):
+                    queued.append(chunk)
+                    if chunk[-1] is not None:
+                        yield chunk[-1]
+
+            for predictions in self.scorer.imap(frames()):
+                while queued[0][-1] is None:
+                    self._store(result, queued.popleft())
+                self._store(result, queued.popleft(), predictions)
+                result.elapsed = time.perf_counter() - started
+            while queued:
+                self._store(result, queued.popleft())
+        result.elapsed = time.perf_counter() - started
+        self.predicted += result.done - result.memo_hits
+        self.memo_hits += result.memo_hits
+        telemetry.count('sweep_points', result.done)
+        telemetry.count('sweep_memo_hits', result.memo_hits)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'predicted': self.predicted, 'memo_hits': self.memo_hits, 'memo_size': len(self._memo)}
+
+
+# --- Standard sweeps ---
+
+def numeric_axis(column, levels=default_levels):
+    """
+    Returns the (column, values) axis spanning the yield cube's range of a numeric input (linearly for
+    rainfall, logarithmically for fertilizer and pesticide).
+    """
+    from yield_cube import axis_levels
+
+    return column, axis_levels(column, levels)
+
+
+def inputs_sweep(base, levels=default_levels):
+    """
+    Fertilizer x Annual_Rainfall x Pesticide around base.
+    """
+    return Sweep(base, [numeric_axis('Fertilizer', levels), numeric_axis('Annual_Rainfall', levels),
+                        numeric_axis('Pesticide', levels)])
+
+
+def states_sweep(base, levels=default_levels):
+    """
+    Every state x Annual_Rainfall x Fertilizer for base's crop, season and year.
+    """
+    return Sweep(base, [('State', state_options), numeric_axis('Annual_Rainfall', levels),
+                        numeric_axis('Fertilizer', levels)])
+
+
+def main(argv=None):
+    from model_artifact import compile_model
+    from yield_model import add_model_arguments, default_model_path, load_model
+
+    parser = argparse.ArgumentParser(description="Time a yield sensitivity sweep")
+    add_model_arguments(parser, backend=False)
+    parser.add_argument("--crop", default='Rice')
+    parser.add_argument("--season", default='Kharif')
+    parser.add_argument("--state", default='Assam')
+    parser.add_argument("--year", type=int, default=2020)
+    parser.add_argument("--rainfall", type=float, default=1500.0, help="base Annual_Rainfall (swept in both sweeps)")
+    parser.add_argument("--fertilizer", type=float, default=1e6, help="base Fertilizer")
+    parser.add_argument("--pesticide", type=float, default=1e4, help="base Pesticide")
+    parser.add_argument("--all-states", action="store_true",
+                        help="sweep State x Annual_Rainfall x Fertilizer instead of Fertilizer x Annual_Rainfall x Pesticide")
+    parser.add_argument("--levels", type=int, default=default_levels, help=f"levels per numeric axis (default: {default_levels})")
+    parser.add_argument("--chunk-rows", type=int, default=default_chunk_rows,
+                        help=f"grid points per model call (default: {default_chunk_rows})")
+    parser.add_argument("--workers", type=int, default=0, help="worker processes (default: score in this process)")
+    parser.add_argument("--out", metavar="PATH", help="save the surface as a .npy array")
+    args = parser.parse_args(argv)
+
+    model_path = args.model or default_model_path()
+    try:
+        model = compile_model(load_model(model_path))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    base = (args.crop, args.year, args.season, args.state, args.rainfall, args.fertilizer, args.pesticide)
+    sweep = (states_sweep if args.all_states else inputs_sweep)(base, args.levels)
+
+    scorer = None
+    if args.workers:
+        from parallel_predict import ShardedScorer
+
+        scorer = ShardedScorer(model_path, workers=args.workers, model=model)
+    try:
+        engine = SweepEngine(model, scorer=scorer, chunk_rows=args.chunk_rows)
+        print(f"sweep: {' x '.join(f'{column} ({len(values)})' for column, values in sweep.axes)} = {sweep.size:,} points")
+        for label in ('first run', 'repeated'):
+            result = engine.run(sweep)
+            print(f"{label:<10} {result.elapsed:8.2f} s  {sweep.size / result.elapsed:>12,.0f} points/s  "
+                  f"memo hits {result.memo_hits:,}")
+    finally:
+        if scorer is not None:
+            scorer.close()
+    print(f"yield range {np.nanmin(result.values):.3f} .. {np.nanmax(result.values):.3f}")
+    if args.out:
+        np.save(args.out, result.values)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Heatmap of a scenario sweep (see sweep.py) for the dashboard.
+
+The first two axes of the sweep are the rows and columns of the heatmap; a third axis, if any, is shown one
+level at a time. The figure, image and colorbar are created once and updated in place, so the partially
+filled SweepResult can be shown again and again while the sweep runs: points not predicted yet are left
+transparent.
+
+Usage (renders a sweep headlessly to a PNG):
+    python sweep_plot.py --crop Rice --all-states --out sweep.png
+"""
+import argparse
+import sys
+
+import numpy as np
+from matplotlib.figure import Figure
+
+from trend_plot import background_color
+
+# Tick labels shown along a numeric axis
+numeric_ticks = 5
+
+
+def format_level(value):
+    if isinstance(value, str):
+        return value
+    return f"{value:,.0f}" if abs(value) < 1e4 else f"{value:.0e}"
+
+
+class SweepHeatmap:
+    """
+    Heatmap of SweepResult slices drawn on a persistent figure. canvas_class is called as
+    canvas_class(figure, **canvas_options), as for trend_plot.TrendPlot.
+
+    As in TrendPlot, the image and title are animated: while the colour scale stays put, an update only
+    blits them over the cached background. The colour scale of a partial result only ever widens, so a
+    running sweep mostly blits; the exact range is set once the sweep has finished.
+    """
+
+    def __init__(self, canvas_class, figsize=(5, 3), **canvas_options):
+        self.figure = Figure(figsize=figsize, facecolor=background_color, layout='tight')
+        self.canvas = canvas_class(self.figure, **canvas_options)
+        ax = self.ax = self.figure.add_subplot()
+        ax.set_facecolor(background_color)
+        ax.tick_params(axis='both', colors='white', labelsize=7)
+        ax.title.set_color('white')
+        ax.title.set_animated(True)
+        self.image = ax.imshow(np.full((1, 1), np.nan), origin='lower', aspect='auto', cmap='viridis',
+                               interpolation='nearest', animated=True)
+        self.colorbar = self.figure.colorbar(self.image, ax=ax)
+        self.colorbar.ax.tick_params(colors='white', labelsize=7)
+        self.colorbar.set_label("Predicted Yield", color='white')
+        self.sweep = None
+
+        self._background = None
+        self.full_redraws = self.blits = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.figure.draw_artist(self.image)
+        self.figure.draw_artist(self.ax.title)
+
+    def _set_axes(self, sweep):
+        """
+        Labels the heatmap for a new sweep: all categories along a categorical axis, a few levels along a
+        numeric one.
+        """
+        self.sweep = sweep
+        (y_column, y_values), (x_column, x_values) = sweep.axes[0], sweep.axes[1]
+        for values, set_ticks, set_labels in ((x_values, self.ax.set_xticks, self.ax.set_xticklabels),
+                                             (y_values, self.ax.set_yticks, self.ax.set_yticklabels)):
+            ticks = np.arange(len(values))
+            if values.dtype.kind != 'U':
+                ticks = np.unique(np.linspace(0, len(values) - 1, numeric_ticks).round().astype(int))
+            set_ticks(ticks)
+            set_labels([format_level(values[i].item()) for i in ticks])
+        self.ax.set_xlabel(x_column, color='white')
+        self.ax.set_ylabel(y_column, color='white')
+        self.image.set_extent((-0.5, len(x_values) - 0.5, -0.5, len(y_values) - 0.5))
+
+    def _color_limits(self, surface, finished, same_sweep):
+        if not np.isfinite(surface).any():
+            return self.image.get_clim()
+        low, high = np.nanmin(surface), np.nanmax(surface)
+        if not finished and same_sweep:
+            current_low, current_high = self.image.get_clim()
+            return min(low, current_low), max(high, current_high)
+        return low, high
+
+    def update(self, result, level=0, title=''):
+        """
+        Shows result (possibly still being filled in) at the given level of its third axis.
+        """
+        same_sweep = result.sweep is self.sweep
+        if not same_sweep:
+            self._set_axes(result.sweep)
+        values = result.values
+        if values.ndim == 1:
+            values = values[:, None]
+        surface = values[(slice(None), slice(None)) + (level,) * (values.ndim - 2)]
+        self.image.set_data(np.ma.masked_invalid(surface))
+        if len(result.sweep.axes) > 2:
+            column, axis_values = result.sweep.axes[2]
+            title = f"{title}  {column} = {format_level(axis_values[level].item())}".strip()
+        if not result.finished:
+            title = f"{title}  ({result.done / result.sweep.size:.0%})"
+        self.ax.set_title(title, color='white', fontsize=9)
+
+        clim = self._color_limits(surface, result.finished, same_sweep)
+        if self._background is not None and same_sweep and clim == self.image.get_clim():
+            self.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.canvas.blit(self.figure.bbox)
+            self.blits += 1
+        else:
+            self.image.set_clim(*clim)
+            self.full_redraws += 1
+            self.canvas.draw_idle()
+
+    def stats(self):
+        return {'full_redraws': self.full_redraws, 'blits': self.blits}
+
+
+def main(argv=None):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    from model_artifact import compile_model
+    from sweep import SweepEngine, default_levels, inputs_sweep, states_sweep
+    from yield_model import add_model_arguments, default_model_path, load_model
+
+    parser = argparse.ArgumentParser(description="Render a yield sensitivity sweep as a heatmap")
+    add_model_arguments(parser, backend=False)
+    parser.add_argument("--crop", default='Rice')
+    parser.add_argument("--season", default='Kharif')
+    parser.add_argument("--state", default='Assam')
+    parser.add_argument("--year", type=int, default=2020)
+    parser.add_argument("--all-states", action="store_true", help="sweep State x Annual_Rainfall x Fertilizer")
+    parser.add_argument("--levels", type=int, default=default_levels, help=f"levels per numeric axis (default: {default_levels})")
+    parser.add_argument("--level", type=int, default=0, help="level of the third axis to show")
+    parser.add_argument("--out", default='sweep.png', help="PNG file to write (default: sweep.png)")
+    args = parser.parse_args(argv)
+
+    try:
+        model = compile_model(load_model(args.model or default_model_path()))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    base = (args.crop, args.year, args.season, args.state, 1500.0, 1e6, 1e4)
+    sweep = (states_sweep if args.all_states else inputs_sweep)(base, args.levels)
+    result = SweepEngine(model).run(sweep)
+    heatmap = SweepHeatmap(FigureCanvasAgg, figsize=(7, 5))
+    heatmap.update(result, min(args.level, sweep.shape[-1] - 1), f"{args.crop}, {args.year}")
+    heatmap.figure.savefig(args.out, facecolor=background_color)
+    print(f"Wrote {args.out} ({sweep.size:,} points in {result.elapsed:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+In-process telemetry for the prediction hot paths: per-stage timers, event counters and latency histograms.
+
+The apps and the headless tools time their stages (input parsing, DataFrame build, encoding, neighbour
+search, plotting, canvas draw, ...) with
+
+    with telemetry.stage('encode'):
+        ...
+
+and count events with telemetry.count('cache_hits', n). Every stage feeds a histogram with fixed
+latency buckets. Telemetry is off unless the CROP_YIELD_TELEMETRY environment variable is set or
+enable() is called; while off, stage() returns a shared do-nothing context manager and count() returns
+at once, so the instrumentation costs well under a microsecond per call.
+
+CROP_YIELD_TELEMETRY=1 prints a summary when the program exits (see dump()); a path ending in .prom or
+.jsonl writes the metrics there instead, as Prometheus text exposition format or JSON lines.
+
+SamplingProfiler samples the Python stacks of the other threads every few milliseconds, for finding what
+a slow stage spends its time on. It can be started and stopped at any time (the apps toggle it with F8,
+serve.py runs it for POST /profile); stacks are reported as self time per function and can be written
+in the collapsed format read by flame graph tools.
+"""
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+env_var = 'CROP_YIELD_TELEMETRY'
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf
+latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+# Metric name prefix of the Prometheus export
+metric_prefix = 'cropyield'
+
+# Seconds between two samples of the sampling profiler
+default_sample_interval = 0.005
+
+# Innermost Python frames of threads that are blocked waiting (thread pool workers, the asyncio and Tk
+# event loops); such samples are counted as idle rather than reported
+idle_frames = frozenset(['thread.py:_worker', 'threading.py:wait', 'queue.py:get', 'selectors.py:select',
+                         '__init__.py:mainloop'])
+
+
+class Histogram:
+    """
+    Counts of observed durations per latency bucket, with their sum.
+    """
+
+    def __init__(self, buckets=latency_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q-th quantile (the largest finite bound for the
+        +Inf bucket), or 0.0 if nothing was observed.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class _Stage:
+    __slots__ = ('telemetry', 'name', 'started')
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.telemetry.record(self.name, time.perf_counter() - self.started)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_stage = _NoStage()
+
+
+class Telemetry:
+    """
+    Thread-safe registry of stage histograms and event counters.
+    """
+
+    def __init__(self, enabled=False, path=None):
+        self.enabled = enabled
+        self.path = path
+        self.histograms = {}
+        self.counters = Counter()
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True, path=None):
+        """
+        Turns telemetry on or off; path, if given, is where dump() writes.
+        """
+        self.enabled = enabled
+        if path:
+            self.path = path
+
+    def stage(self, name):
+        """
+        Returns a context manager timing the block as one observation of stage name.
+        """
+        if not self.enabled:
+            return _no_stage
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """
+        Records an already measured duration of stage name.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += n
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """
+        Returns {'stages': {name: {count, sum_s, p50_s, p99_s}}, 'counters': {name: value}}.
+        """
+        with self._lock:
+            return {
+                'stages': {name: {'count': h.count, 'sum_s': h.sum, 'p50_s': h.quantile(0.5), 'p99_s': h.quantile(0.99)}
+                           for name, h in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    # --- Export ---
+
+    def prometheus_text(self):
+        """
+        Returns the metrics in the Prometheus text exposition format: one histogram family with a stage
+        label and one counter family with an event label.
+        """
+        lines = []
+        with self._lock:
+            if self.histograms:
+                family = f'{metric_prefix}_stage_seconds'
+                lines += [f'# HELP {family} Duration of each instrumented stage.', f'# TYPE {family} histogram']
+                for name, histogram in sorted(self.histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{family}_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                    lines.append(f'{family}_sum{{stage="{name}"}} {histogram.sum!r}')
+                    lines.append(f'{family}_count{{stage="{name}"}} {histogram.count}')
+            if self.counters:
+                family = f'{metric_prefix}_events_total'
+                lines += [f'# HELP {family} Number of each counted event.', f'# TYPE {family} counter']
+                for name, value in sorted(self.counters.items()):
+                    lines.append(f'{family}{{event="{name}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def json_lines(self):
+        """
+        Returns the metrics as JSON lines: one object per stage histogram and per counter.
+        """
+        now = time.time()
+        lines = []
+        with self._lock:
+            for name, histogram in sorted(self.histograms.items()):
+                lines.append({'time': now, 'type': 'histogram', 'stage': name, 'count': histogram.count,
+                              'sum_s': histogram.sum, 'p50_s': histogram.quantile(0.5),
+                              'p99_s': histogram.quantile(0.99),
+                              'buckets': {('+Inf' if i == len(histogram.buckets) else repr(histogram.buckets[i])): count
+                                          for i, count in enumerate(histogram.counts)}})
+            for name, value in sorted(self.counters.items()):
+                lines.append({'time': now, 'type': 'counter', 'event': name, 'value': value})
+        return ''.join(json.dumps(line) + '\n' for line in lines)
+
+    def write(self, path):
+        """
+        Writes the metrics to path: JSON lines (appended) if it ends in .jsonl, else Prometheus text.
+        """
+        if path.endswith('.jsonl'):
+            with open(path, 'a') as f:
+                f.write(self.json_lines())
+        else:
+            with open(path, 'w') as f:
+                f.write(self.prometheus_text())
+
+    def summary(self):
+        """
+        Returns a human-readable table of the stages and counters.
+        """
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<22} {'count':>8} {'total ms':>10} {'p50 ms':>8} {'p99 ms':>8}"]
+        for name, stage in snapshot['stages'].items():
+            lines.append(f"{name:<22} {stage['count']:>8} {stage['sum_s'] * 1e3:>10.1f} "
+                         f"{stage['p50_s'] * 1e3:>8.2f} {stage['p99_s'] * 1e3:>8.2f}")
+        for name, value in snapshot['counters'].items():
+            lines.append(f"{name:<22} {value:>8}")
+        return '\n'.join(lines)
+
+    def dump(self, path=None):
+        """
+        Writes the metrics to path, by default the one given to enable() or by CROP_YIELD_TELEMETRY, or
+        prints the summary to stderr if there is none. Does nothing while telemetry is off.
+        """
+        if not self.enabled:
+            return
+        path = path or self.path
+        if path:
+            self.write(path)
+            print(f"Telemetry written to '{path}'.", file=sys.stderr)
+        else:
+            print(f"Telemetry:\n{self.summary()}", file=sys.stderr)
+
+    # --- Sampling profiler ---
+
+    def start_profiler(self, interval=default_sample_interval):
+        """
+        Starts sampling the stacks of the other threads, unless already running. Returns the profiler.
+        """
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval)
+            self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        """
+        Stops the running profiler and returns it (None if none was running).
+        """
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    def toggle_profiler(self, interval=default_sample_interval):
+        """
+        Starts the profiler, or stops it and prints its report to stderr. Returns True if it is now running.
+        """
+        if self.profiler is None:
+            self.start_profiler(interval)
+            print("Sampling profiler started.", file=sys.stderr)
+            return True
+        profiler = self.stop_profiler()
+        print(profiler.report(), file=sys.stderr)
+        return False
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every other thread every interval seconds from a daemon thread. Stacks are
+    counted in the collapsed format (outermost frame first, frames joined by ';'); samples of threads
+    waiting in one of idle_frames are only counted in idle_samples.
+    """
+
+    def __init__(self, interval=default_sample_interval, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = self.idle_samples = 0
+        self.started = self.stopped = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if _frame_label(frame) in idle_frames:
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, n=15):
+        """
+        Returns [(function, samples)] for the n functions most often on top of a stack (self time).
+        """
+        functions = Counter()
+        for stack, count in self.stacks.items():
+            functions[stack.rsplit(';', 1)[-1]] += count
+        return functions.most_common(n)
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write_collapsed(self, path):
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+    def report(self, n=15):
+        duration = (self.stopped or time.perf_counter()) - self.started
+        total = sum(self.stacks.values()) or 1
+        lines = [f"Sampling profile: {self.samples} samples over {duration:.1f} s, {sum(self.stacks.values())} busy "
+                 f"thread stacks (self time per function)"]
+        for function, count in self.top(n):
+            lines.append(f"  {count / total:6.1%}  {function}")
+        return '\n'.join(lines)
+
+
+def _from_environment():
+    setting = os.environ.get(env_var, '')
+    return Telemetry(enabled=setting not in ('', '0'), path=setting if setting.endswith(('.prom', '.jsonl')) else None)
+
+
+# Shared by all modules of the process
+telemetry = _from_environment()
@@ -0,0 +1,171 @@
+"""
+Persistent yield trend figure for the dashboard.
+
+The figure, its canvas and its artists (trend line, highlighted point, annotation and title) are created
+once and updated in place for every prediction, so a long session never accumulates figures. The changing
+artists are animated: when the axes limits do not need to move, a redraw only restores the cached
+background and blits them; otherwise a full redraw is requested with draw_idle(). Redraw latencies are
+recorded for every update.
+
+Usage (headless soak test: memory and redraw latency over many updates on an Agg canvas):
+    python trend_plot.py --updates 5000
+"""
+import argparse
+import sys
+import time
+from collections import deque
+
+from matplotlib.figure import Figure
+
+from telemetry import telemetry
+
+background_color = '#2b2b2b'
+# Number of recent redraw latencies kept for the statistics
+latency_window = 1000
+
+
+class TrendPlot:
+    """
+    Yield trend plot drawn on a persistent figure. canvas_class is the FigureCanvas to attach, called as
+    canvas_class(figure, **canvas_options), e.g. FigureCanvasTkAgg with master=... in the dashboard.
+    """
+
+    def __init__(self, canvas_class, figsize=(5, 3), **canvas_options):
+        # Not created through pyplot, so the figure is never held by pyplot's figure registry
+        self.figure = Figure(figsize=figsize, facecolor=background_color, layout='tight')  # Dark background
+        self.canvas = canvas_class(self.figure, **canvas_options)
+        ax = self.ax = self.figure.add_subplot()
+        ax.set_facecolor(background_color)  # Dark plot background
+        ax.set_xlabel("Year", color='white')
+        ax.set_ylabel("Predicted Yield", color='white')
+        ax.grid(True, color='gray', linestyle='--', alpha=0.5)
+        ax.tick_params(axis='both', colors='white')
+
+        self.line, = ax.plot([], [], marker='o', color='#00CC96', linewidth=2, animated=True)  # Bright line color
+        self.point = ax.scatter([], [], color='yellow', s=100, zorder=5, animated=True)  # Highlight entered year
+        self.annotation = ax.annotate('', xy=(0, 0), xytext=(0, 0), color='white', fontsize=10,
+                                      bbox=dict(facecolor='black', alpha=0.5, edgecolor='white'),
+                                      ha='center', animated=True)
+        ax.title.set_color('white')
+        ax.title.set_animated(True)
+        self.animated = (self.line, self.point, self.annotation, ax.title)
+
+        self._background = None
+        self._full_draw_started = None
+        self.latencies = deque(maxlen=latency_window)
+        self.full_redraws = self.blits = 0
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """
+        After a full redraw: caches the background without the animated artists, then draws them on top.
+        """
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+        if self._full_draw_started is not None:
+            latency = time.perf_counter() - self._full_draw_started
+            self.latencies.append(latency)
+            telemetry.record('canvas_draw', latency)
+            self._full_draw_started = None
+
+    def _draw_animated(self):
+        for artist in self.animated:
+            self.figure.draw_artist(artist)
+
+    def _limits(self, years, yields, predicted_yield):
+        """
+        Returns the axes limits for a trend. The current limits are kept while the new values (and the
+        annotation above the entered year) fit and fill at least half of them, so that similar
+        predictions can be blitted without rescaling.
+        """
+        spread = max(yields) - min(yields)
+        low = min(yields)
+        high = max(max(yields), predicted_yield + 0.1 * spread)
+        margin = 0.1 * (high - low) or 0.1 * abs(high) or 1.0
+        return (self._sticky(self.ax.get_xlim(), years[0], years[-1], 0.5),
+                self._sticky(self.ax.get_ylim(), low, high, margin))
+
+    def _sticky(self, current, low, high, margin):
+        current_low, current_high = current
+        fits = current_low <= low - 0.5 * margin and high + 0.5 * margin <= current_high
+        if self._background is not None and fits and (high - low) + 2 * margin >= 0.5 * (current_high - current_low):
+            return current
+        return low - margin, high + margin
+
+    def update(self, years, yields, crop, state):
+        """
+        Shows the trend of yields over years; the first year is the entered one and is annotated.
+        """
+        started = time.perf_counter()
+        predicted_yield = yields[0]
+        self.line.set_data(years, yields)
+        self.point.set_offsets([[years[0], predicted_yield]])
+        self.annotation.set_text(f'{predicted_yield:.2f}')
+        self.annotation.xy = (years[0], predicted_yield)
+        self.annotation.set_position((years[0], predicted_yield + 0.1 * (max(yields) - min(yields))))  # Offset above point
+        self.ax.set_title(f"Yield Trend for {crop} in {state}")
+
+        xlim, ylim = self._limits(years, yields, predicted_yield)
+        if self._background is not None and xlim == self.ax.get_xlim() and ylim == self.ax.get_ylim():
+            # Only the animated artists changed: restore the cached background and blit them
+            self.canvas.restore_region(self._background)
+            self._draw_animated()
+            self.canvas.blit(self.figure.bbox)
+            self.blits += 1
+            latency = time.perf_counter() - started
+            self.latencies.append(latency)
+            telemetry.record('canvas_blit', latency)
+        else:
+            self.ax.set_xlim(xlim)
+            self.ax.set_ylim(ylim)
+            self._full_draw_started = started
+            self.full_redraws += 1
+            self.canvas.draw_idle()
+
+    def stats(self):
+        """
+        Returns the number of full redraws and blits and the median and worst recent redraw latency in ms.
+        """
+        ordered = sorted(self.latencies)
+        return {
+            'full_redraws': self.full_redraws,
+            'blits': self.blits,
+            'p50_ms': ordered[len(ordered) // 2] * 1e3 if ordered else 0.0,
+            'max_ms': ordered[-1] * 1e3 if ordered else 0.0,
+        }
+
+
+def main(argv=None):
+    import random
+    import resource
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    parser = argparse.ArgumentParser(description="Soak test of the persistent trend plot")
+    parser.add_argument("--updates", type=int, default=5000, help="number of trend updates to draw")
+    args = parser.parse_args(argv)
+
+    plot = TrendPlot(FigureCanvasAgg)
+    rng = random.Random(0)
+    rss = []
+    start_year, base = 2015, 1.0
+    for i in range(args.updates):
+        # A session mostly tweaks the numeric inputs; now and then the year or the crop changes
+        if rng.random() < 0.1:
+            start_year = rng.randrange(1997, 2020)
+        if rng.random() < 0.1:
+            base = rng.choice((1.0, 1.2, 5.0, 50.0))
+        yields = [base * (1 + 0.05 * rng.random()) for _ in range(10)]
+        plot.update(list(range(start_year, start_year + 10)), yields, 'Rice', 'Assam')
+        if i % max(1, args.updates // 10) == 0 or i == args.updates - 1:
+            rss.append(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+    stats = plot.stats()
+    print(f"updates: {args.updates}  full redraws: {stats['full_redraws']}  blits: {stats['blits']}")
+    print(f"redraw latency: p50 {stats['p50_ms']:.2f} ms  max {stats['max_ms']:.2f} ms")
+    print("peak RSS (MB) over the run: " + " ".join(f"{value:.0f}" for value in rss))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,480 @@
+"""
+Precomputed yield lookup cube over the dropdown vocabularies.
+
+build_cube() evaluates the model once over every (crop, season, state) option combination x Crop_Year x
+quantized Annual_Rainfall/Fertilizer/Pesticide levels and stores the predictions as one float32 array,
+values.npy, of shape (slices, years, rainfall levels, fertilizer levels, pesticide levels). Option
+combinations that the model cannot tell apart (e.g. values missing from its one-hot encoder) share a
+slice, recorded in slice_index.npy. Fertilizer and pesticide levels are spaced logarithmically.
+
+YieldCube memory-maps the cube and answers by multilinear interpolation between the 16 surrounding grid
+points, without any neighbour search. The KNN model is piecewise constant, so interpolation can be off
+inside a cell. Rows whose surrounding grid values spread by more than atol + rtol * |value|, or that lie
+outside the grid, are passed to the exact model. The spread is a heuristic, not a bound: the model can
+change inside a cell whose corners agree, so some accepted rows miss the exact prediction by more than
+the tolerance. `check` reports how many.
+
+predict_rows() takes 7-tuples like the compiled model (see model_artifact.compile_model()) and sends only
+the rows the cube cannot answer to the compiled fallback model's predict_rows(), without pandas.
+
+Building evaluates the model at every grid point: the default grid is 1620 (crop, season, state) slices
+for the exported model x 34 years x 6^3 levels, about 11.9 million predictions, which takes over an hour
+on one core at a few thousand rows per second. Use --workers, a shorter --years range or fewer levels
+for a quicker build; the build prints the number of predictions before it starts.
+
+load_model() opens a cube directory as a YieldCube that falls back to the model it was built from, so
+it can be selected like any other model (e.g. CROP_YIELD_MODEL=yield_cube). If that model has changed
+since the cube was built, the cube is stale: opening it prints a warning and every row is answered by
+the model.
+
+A cube is built in a staging directory and moved into place (see model_artifact.publish_directory()),
+so rebuilding it is safe while an app has it open.
+
+Usage:
+    python yield_cube.py build [--model knn_crop_yield_model] [--years 1997:2030] [--levels 6] [--rainfall-levels 24] [--out yield_cube]
+    python yield_cube.py check [--cube yield_cube] [--rows 2000]
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from model_artifact import publish_directory, staging_directory
+from yield_model import prediction_features, crop_options, season_options, state_options
+
+# Bumped whenever the on-disk layout changes
+cube_version = 1
+
+cube_dirname = 'yield_cube'
+manifest_filename = 'cube.json'
+
+# Default grid: Crop_Year range and number of levels per numeric input
+default_years = (1997, 2030)
+default_levels = 6
+axis_ranges = {
+    'Annual_Rainfall': (300.0, 4000.0, 'linear'),
+    'Fertilizer': (1e3, 1e8, 'log'),
+    'Pesticide': (1e1, 1e6, 'log'),
+}
+
+# Command line option prefix of each numeric axis, e.g. --rainfall-levels
+axis_options = {'Annual_Rainfall': 'rainfall', 'Fertilizer': 'fertilizer', 'Pesticide': 'pesticide'}
+
+default_rtol = 0.05
+default_atol = 0.01
+
+# Rows per model call while building
+build_chunk_rows = 16384
+
+categorical_options = {'Crop': crop_options, 'Season': season_options, 'State': state_options}
+
+
+def is_cube(path):
+    """
+    Returns True if path is a directory containing a built yield cube.
+    """
+    return os.path.isfile(os.path.join(path, manifest_filename))
+
+
+def _known_categories(model):
+    """
+    Returns {column: set of categories} known to the model's one-hot encoder, or None if the model does
+    not expose them (then no option combinations are merged).
+    """
+    if hasattr(model, 'named_steps'):
+        preprocessor = model.named_steps['preprocessor']
+        encoder = preprocessor.named_transformers_['cat']
+        return {column: {str(value) for value in categories}
+                for column, categories in zip(preprocessor.transformers_[1][2], encoder.categories_)}
+    from model_artifact import MappedKNNModel
+
+    if isinstance(model, MappedKNNModel):
+        if not model._loaded:
+            model._load()
+        return {column: set(codes) for column, codes in zip(model.categorical_columns, model.category_codes)}
+    return None
+
+
+def _slice_index(model):
+    """
+    Returns (slice_index, representatives): slice_index[crop, season, state] is the cube slice of each
+    option combination, and representatives lists one (crop, season, state) per slice.
+    """
+    known = _known_categories(model)
+    shape = tuple(len(options) for options in categorical_options.values())
+    slice_index = np.empty(shape, dtype=np.int32)
+    slices = {}
+    for position in itertools.product(*(range(n) for n in shape)):
+        values = tuple(options[i] for options, i in zip(categorical_options.values(), position))
+        if known is None:
+            key = values
+        else:
+            # Every value the encoder does not know is encoded identically (all zeros)
+            key = tuple(value if value in known[column] else None
+                        for column, value in zip(categorical_options, values))
+        slice_index[position] = slices.setdefault(key, (len(slices), values))[0]
+    return slice_index, [values for _, values in sorted(slices.values())]
+
+
+def axis_levels(name, levels):
+    low, high, scale = axis_ranges[name]
+    if scale == 'log':
+        return np.geomspace(low, high, levels)
+    return np.linspace(low, high, levels)
+
+
+def build_cube(model, directory, years=default_years, levels=default_levels, source_path=None, scorer=None,
+               progress=None):
+    """
+    Evaluates model over the grid and writes the cube to directory. levels is the number of grid levels
+    of every numeric axis, or a dict of them by column name. If scorer (a
+    parallel_predict.ShardedScorer) is given the chunks are predicted by its worker processes. progress,
+    if given, is called with the number of slices done. Returns the manifest.
+    """
+    import pandas as pd
+
+    from prediction_cache import model_hash
+
+    year_axis = np.arange(years[0], years[1] + 1)
+    if not isinstance(levels, dict):
+        levels = dict.fromkeys(axis_ranges, levels)
+    numeric_axes = {name: axis_levels(name, levels[name]) for name in axis_ranges}
+    slice_index, representatives = _slice_index(model)
+
+    # The numeric part of the grid is the same for every slice
+    grid = np.meshgrid(year_axis, *numeric_axes.values(), indexing='ij')
+    grid = {name: axis.reshape(-1) for name, axis in zip(['Crop_Year', *numeric_axes], grid)}
+    grid_size = len(grid['Crop_Year'])
+    slices_per_chunk = max(1, build_chunk_rows // grid_size)
+
+    def chunks():
+        for start in range(0, len(representatives), slices_per_chunk):
+            batch = representatives[start:start + slices_per_chunk]
+            columns = {name: np.tile(values, len(batch)) for name, values in grid.items()}
+            for i, column in enumerate(categorical_options):
+                columns[column] = np.repeat([values[i] for values in batch], grid_size)
+            yield pd.DataFrame(columns, columns=prediction_features)
+
+    source_path = os.path.abspath(source_path) if source_path else None
+    manifest = {
+        'cube_version': cube_version,
+        'categorical_options': categorical_options,
+        'axes': {'Crop_Year': {'values': year_axis.tolist(), 'scale': 'linear'},
+                 **{name: {'values': axis.tolist(), 'scale': axis_ranges[name][2]} for name, axis in numeric_axes.items()}},
+        'source': source_path,
+        'source_sha256': model_hash(source_path) if source_path else None,
+    }
+
+    shape = (len(representatives), len(year_axis), *(len(axis) for axis in numeric_axes.values()))
+    staging = staging_directory(directory)
+    try:
+        values = np.lib.format.open_memmap(os.path.join(staging, 'values.npy'), mode='w+', dtype=np.float32, shape=shape)
+        predictions = scorer.imap(chunks()) if scorer is not None else (model.predict(chunk) for chunk in chunks())
+        done = 0
+        for chunk_predictions in predictions:
+            count = len(chunk_predictions) // grid_size
+            values[done:done + count] = np.asarray(chunk_predictions, dtype=np.float32).reshape((count,) + shape[1:])
+            done += count
+            if progress is not None:
+                progress(done)
+        values.flush()
+        del values
+        np.save(os.path.join(staging, 'slice_index.npy'), slice_index)
+        with open(os.path.join(staging, manifest_filename), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        # The directory only counts as a cube once the manifest is in place, so it goes last
+        publish_directory(staging, directory, last=manifest_filename)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return manifest
+
+
+class YieldCube:
+    """
+    Interpolating lookup into a built cube, with the same predict() interface as the model. Nothing is
+    read from disk until the first lookup.
+
+    fallback_model answers the rows whose interpolation error bound exceeds atol + rtol * |value| or that
+    lie outside the grid; by default it is the model the cube was built from, loaded on first use. With
+    fallback_model=False the interpolated value is always returned, and NaN outside the grid.
+
+    The cube is checked against the model it was built from when it is first read: if that model has
+    changed since, a warning is printed and stale is set, and every row goes to fallback_model.
+    """
+
+    def __init__(self, directory, fallback_model=None, rtol=default_rtol, atol=default_atol):
+        if not is_cube(directory):
+            raise FileNotFoundError(f"Yield cube '{directory}' not found.")
+        self.directory = directory
+        self.fallback_model = fallback_model
+        self.rtol = rtol
+        self.atol = atol
+        self.lookups = self.fallbacks = 0
+        self.stale = False
+        self._loaded = False
+
+    def _load(self):
+        with open(os.path.join(self.directory, manifest_filename)) as f:
+            manifest = json.load(f)
+        if manifest['cube_version'] != cube_version:
+            raise ValueError(f"Unsupported yield cube version {manifest['cube_version']}")
+        self.manifest = manifest
+        self.values = np.load(os.path.join(self.directory, 'values.npy'), mmap_mode='r')
+        self.slice_index = np.load(os.path.join(self.directory, 'slice_index.npy'))
+        self.option_codes = [{value: code for code, value in enumerate(options)}
+                             for options in manifest['categorical_options'].values()]
+        # Interpolation happens in log space along the log-spaced axes
+        self.axes = [(name, np.log(axis['values']) if axis['scale'] == 'log' else np.asarray(axis['values'], dtype=np.float64),
+                      axis['scale']) for name, axis in manifest['axes'].items()]
+        self._corners = np.array(list(itertools.product((0, 1), repeat=len(self.axes))), dtype=np.intp)
+        self._loaded = True
+        self.stale = self.is_stale()
+        if self.stale:
+            print(f"Warning: yield cube '{self.directory}' is stale: '{self.source_path()}' has changed since it was "
+                  f"built. Rebuild it with 'python yield_cube.py build'.", file=sys.stderr)
+
+    def source_path(self):
+        """
+        Returns the path of the model the cube was built from (None if unknown). Relative paths, written
+        by older builds, are taken relative to the directory holding the cube.
+        """
+        source = self.manifest['source']
+        if source is None or os.path.isabs(source):
+            return source
+        return os.path.join(os.path.dirname(os.path.abspath(self.directory)), source)
+
+    def _fallback(self):
+        if self.fallback_model is None:
+            from model_artifact import compile_model
+            from yield_model import load_model
+
+            if self.source_path() is None:
+                raise ValueError(f"Yield cube '{self.directory}' does not record the model it was built from")
+            # Compiled for the pandas-free predict_rows() path of the KNN model
+            self.fallback_model = compile_model(load_model(self.source_path()))
+        return self.fallback_model
+
+    def interpolate(self, X):
+        """
+        Returns (values, spreads) for the rows of a DataFrame with the prediction feature columns, where
+        spreads is the range of the grid values interpolated between. Both are NaN for rows outside the
+        grid or with options the cube was not built for.
+        """
+        return self._interpolate(len(X), X)
+
+    def _interpolate(self, n, columns):
+        """
+        interpolate() for n rows given as {column: sequence of values} (a DataFrame or a dict).
+        """
+        if not self._loaded:
+            self._load()
+        codes = [np.fromiter((lookup.get(value, -1) for value in columns[column]), dtype=np.intp, count=n)
+                 for lookup, column in zip(self.option_codes, self.manifest['categorical_options'])]
+        inside = np.all([c >= 0 for c in codes], axis=0)
+
+        lower, fraction = [], []
+        for name, axis, scale in self.axes:
+            position = np.asarray(columns[name], dtype=np.float64)
+            if scale == 'log':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    position = np.log(position)
+            inside &= (position >= axis[0]) & (position <= axis[-1])
+            i = np.clip(np.searchsorted(axis, position, side='right') - 1, 0, len(axis) - 2)
+            lower.append(i)
+            fraction.append(np.where(inside, (position - axis[i]) / (axis[i + 1] - axis[i]), 0.0))
+
+        slices = np.where(inside, self.slice_index[tuple(np.where(inside, c, 0) for c in codes)], 0)
+        # All 16 corners at once: one row per corner, one column per query row
+        corners = self._corners
+        weights = np.ones((len(corners), n))
+        for axis, (i, t) in enumerate(zip(lower, fraction)):
+            weights *= np.where(corners[:, axis, None], t, 1.0 - t)
+        corner_values = self.values[(slices, *(i + corners[:, axis, None] for axis, i in enumerate(lower)))].astype(np.float64)
+        values = (weights * corner_values).sum(axis=0)
+        used = weights > 0
+        spreads = np.where(used, corner_values, -np.inf).max(axis=0) - np.where(used, corner_values, np.inf).min(axis=0)
+        values[~inside] = np.nan
+        return values, np.where(inside, spreads, np.nan)
+
+    def _needs_model(self, values, spreads):
+        """
+        Returns the rows to pass to the exact model: outside the grid, spread beyond the tolerance, or all
+        of them if the cube is stale.
+        """
+        return np.isnan(values) | (spreads > self.atol + self.rtol * np.abs(values)) | self.stale
+
+    def _count(self, exact):
+        self.lookups += len(exact)
+        self.fallbacks += int(exact.sum())
+
+    def predict(self, X):
+        """
+        Predicts the yield for every row of a DataFrame with the prediction feature columns.
+        """
+        values, spreads = self.interpolate(X)
+        if self.fallback_model is False:
+            self.lookups += len(values)
+            return values
+        exact = self._needs_model(values, spreads)
+        self._count(exact)
+        if exact.any():
+            values[exact] = self._fallback().predict(X[prediction_features][exact])
+        return values
+
+    def predict_rows(self, rows):
+        """
+        Predicts a sequence of 7-tuples in prediction feature order without building a DataFrame; rows
+        the cube cannot answer go to the fallback model's predict_rows() if it has one. Returns a NumPy
+        array.
+        """
+        rows = list(rows)
+        if not rows:
+            return np.empty(0)
+        values, spreads = self._interpolate(len(rows), dict(zip(prediction_features, zip(*rows))))
+        if self.fallback_model is False:
+            self.lookups += len(values)
+            return values
+        exact = self._needs_model(values, spreads)
+        self._count(exact)
+        if exact.any():
+            from prediction_cache import predict_model_rows
+
+            values[exact] = predict_model_rows(self._fallback(), [rows[i] for i in np.flatnonzero(exact)])
+        return values
+
+    def stats(self):
+        return {'lookups': self.lookups, 'fallbacks': self.fallbacks,
+                'fallback_rate': self.fallbacks / self.lookups if self.lookups else 0.0}
+
+    def is_stale(self):
+        """
+        Returns True if the model the cube was built from has changed since. A model that no longer
+        exists cannot be checked and counts as unchanged (the fallback then fails when first needed).
+        """
+        from prediction_cache import model_hash
+
+        if not self._loaded:
+            self._load()
+        if self.manifest['source_sha256'] is None:
+            return False
+        source = self.source_path()
+        return os.path.exists(source) and model_hash(source) != self.manifest['source_sha256']
+
+
+# --- Command line ---
+
+def parse_years(text):
+    first, _, last = text.partition(':')
+    years = (int(first), int(last or first))
+    if years[1] < years[0] + 1:
+        raise argparse.ArgumentTypeError("the year range must span at least two years, e.g. 1997:2030")
+    return years
+
+
+def check_cube(cube, rows):
+    """
+    Compares interpolated and fallback-corrected answers with the exact model on random rows inside the
+    grid and prints the error, the fallback rate and how many answered rows miss the tolerance.
+    """
+    from yield_model import synthetic_frame
+
+    cube._load()
+    frame = synthetic_frame(rows, seed=7)
+    rng = np.random.default_rng(7)
+    for name, axis, scale in cube.axes:
+        low, high = (np.exp(axis[[0, -1]]) if scale == 'log' else axis[[0, -1]])
+        frame[name] = rng.integers(int(low), int(high) + 1, rows) if name == 'Crop_Year' else (
+            np.exp(rng.uniform(np.log(low), np.log(high), rows)) if scale == 'log' else rng.uniform(low, high, rows))
+
+    exact_model = cube._fallback()
+    start = time.perf_counter()
+    exact = exact_model.predict(frame)
+    exact_time = time.perf_counter() - start
+    start = time.perf_counter()
+    interpolated, _ = cube.interpolate(frame)
+    lookup_time = time.perf_counter() - start
+    start = time.perf_counter()
+    answered = cube.predict(frame)
+    predict_time = time.perf_counter() - start
+
+    error = np.abs(interpolated - exact)
+    accepted = ~cube._needs_model(*cube.interpolate(frame))
+    violations = accepted & (np.abs(answered - exact) > cube.atol + cube.rtol * np.abs(exact))
+    print(f"cube: {cube.values.shape[0]} slices x {' x '.join(str(len(axis)) for _, axis, _ in cube.axes)} grid, "
+          f"{cube.values.nbytes / 2 ** 20:.1f} MiB, stale: {cube.is_stale()}")
+    print(f"interpolation only:  mean |error| {error.mean():.4f}  p99 {np.percentile(error, 99):.4f}  "
+          f"{lookup_time / rows * 1e6:.1f} us/row")
+    print(f"with fallback:       mean |error| {np.abs(answered - exact).mean():.4f}  "
+          f"fallback rate {cube.stats()['fallback_rate']:.1%}  {predict_time / rows * 1e6:.1f} us/row")
+    print(f"tolerance misses:    {violations.sum()} of {accepted.sum()} rows answered by the cube "
+          f"({violations.sum() / max(accepted.sum(), 1):.1%}), max |error| "
+          f"{np.abs(answered - exact)[accepted].max(initial=0.0):.4f}")
+    print(f"exact model:         {exact_time / rows * 1e6:.1f} us/row")
+
+
+def main(argv=None):
+    from yield_model import add_model_arguments, default_model_path, load_model
+
+    parser = argparse.ArgumentParser(description="Precomputed yield lookup cube")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="evaluate the model over the grid and write the cube")
+    add_model_arguments(build_parser)
+    build_parser.add_argument("--years", type=parse_years, default=default_years,
+                              help=f"first:last Crop_Year of the grid (default: {default_years[0]}:{default_years[1]})")
+    build_parser.add_argument("--levels", type=int, default=default_levels,
+                              help=f"grid levels per rainfall/fertilizer/pesticide axis (default: {default_levels})")
+    for name in axis_ranges:
+        build_parser.add_argument(f"--{axis_options[name]}-levels", type=int, default=None,
+                                  help=f"grid levels of {name} (default: --levels)")
+    build_parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1)")
+    build_parser.add_argument("--out", default=cube_dirname, help=f"output directory (default: {cube_dirname})")
+    check_parser = commands.add_parser("check", help="measure interpolation error against the exact model")
+    check_parser.add_argument("--cube", default=cube_dirname, help=f"cube directory (default: {cube_dirname})")
+    check_parser.add_argument("--rows", type=int, default=2000, help="random rows inside the grid")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "check":
+            check_cube(YieldCube(args.cube), args.rows)
+            return 0
+
+        levels = {name: getattr(args, f"{axis_options[name]}_levels") or args.levels for name in axis_ranges}
+        if min(levels.values()) < 2:
+            parser.error("every axis needs at least 2 levels")
+        model_path = args.model or default_model_path()
+        model = load_model(model_path, backend=args.backend)
+        slices = len(_slice_index(model)[1])
+        predictions = slices * (args.years[1] - args.years[0] + 1) * int(np.prod(list(levels.values())))
+        print(f"Evaluating {slices} slices x {args.years[1] - args.years[0] + 1} years x "
+              f"{' x '.join(str(n) for n in levels.values())} levels = {predictions:,} predictions", file=sys.stderr)
+        start = time.perf_counter()
+
+        def progress(done):
+            print(f"\r{done} of {slices} slices", end='', file=sys.stderr, flush=True)
+
+        scorer = None
+        if args.workers > 1:
+            from parallel_predict import ShardedScorer
+
+            scorer = ShardedScorer(model_path, workers=args.workers, model=model, backend=args.backend)
+        try:
+            manifest = build_cube(model, args.out, args.years, levels, source_path=model_path,
+                                  scorer=scorer, progress=progress)
+        finally:
+            if scorer is not None:
+                scorer.close()
+        print(f"\nWrote {args.out} ({' x '.join(str(len(axis['values'])) for axis in manifest['axes'].values())} grid) "
+              f"in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Shared model schema and loading helpers used by the GUI apps and the headless tools.
+"""
+import os
+import pickle
+
+# Define the filename for the saved model
+model_filename = 'knn_crop_yield_model.pkl'
+
+# Directory holding the memory-mapped export of the model (see model_artifact.py)
+artifact_dirname = 'knn_crop_yield_model'
+
+# Environment variable selecting the model used by the apps, e.g. crop_yield_model.h5 (see keras_numpy.py)
+model_env_var = 'CROP_YIELD_MODEL'
+
+# Define the features that the model expects (must match training features)
+prediction_features = ['Crop', 'Crop_Year', 'Season', 'State', 'Annual_Rainfall', 'Fertilizer', 'Pesticide']
+numeric_features = ['Crop_Year', 'Annual_Rainfall', 'Fertilizer', 'Pesticide']
+
+# Number of years (starting at the entered year) covered by a yield trend
+trend_horizon = 10
+
+# Values offered in the dropdowns (Placeholder - replace with loading from your data)
+crop_options = [
+    'Rice', 'Maize', 'Moong(Green Gram)', 'Urad', 'Groundnut', 'Sesamum',
+    'Potato', 'Sugarcane', 'Wheat', 'Rapeseed &Mustard', 'Bajra', 'Jowar',
+    'Arhar/Tur', 'Ragi', 'Gram', 'Small Millets', 'Cotton(Lint)', 'Onion',
+    'Sunflower', 'Dry Chillies', 'Other Kharif Pulses', 'Horse-Gram',
+    'Peas & Beans (Pulses)', 'Tobacco', 'Other Rabi Pulses', 'Soyabean',
+    'Turmeric', 'Masoor', 'Ginger', 'Linseed', 'Castor Seed', 'Barley',
+    'Sweet Potato', 'Garlic', 'Banana', 'Mesta', 'Tapioca', 'Coriander',
+    'Niger Seed', 'Jute', 'Coconut', 'Safflower', 'Arecanut', 'Sannhamp',
+    'Other Cereals', 'Cashewnut', 'Cowpea(Lobia)', 'Black Pepper',
+    'Other Oilseeds', 'Moth', 'Khesari', 'Cardamom', 'Guar Seed',
+    'Oilseeds Total', 'Other Summer Pulses'
+]
+season_options = ['Kharif', 'Rabi', 'Whole Year', 'Summer', 'Autumn', 'Winter']
+state_options = [
+    'Karnataka', 'Andhra Pradesh', 'West Bengal', 'Chhattisgarh', 'Bihar',
+    'Madhya Pradesh', 'Uttar Pradesh', 'Tamil Nadu', 'Gujarat', 'Maharashtra',
+    'Odisha', 'Assam', 'Uttarakhand', 'Nagaland', 'Puducherry', 'Meghalaya',
+    'Jammu And Kashmir', 'Haryana', 'Himachal Pradesh', 'Kerala', 'Manipur',
+    'Tripura', 'Mizoram', 'Punjab', 'Telangana', 'Arunachal Pradesh',
+    'Jharkhand', 'Goa', 'Sikkim', 'Delhi'
+]
+
+
+def default_model_path():
+    """
+    Returns the model named by the CROP_YIELD_MODEL environment variable if set, else the memory-mapped
+    artifact directory if it has been exported, else the pickled model.
+    """
+    from model_artifact import is_artifact
+
+    if os.environ.get(model_env_var):
+        return os.environ[model_env_var]
+    return artifact_dirname if is_artifact(artifact_dirname) else model_filename
+
+
+def load_model(path=None, backend=None):
+    """
+    Opens a model artifact directory (lazily, see model_artifact.MappedKNNModel), a precomputed yield
+    cube (see yield_cube.YieldCube), a Keras .h5 network (run with NumPy, see keras_numpy.NetworkModel)
+    or unpickles the trained pipeline, defaulting to default_model_path(). backend selects the
+    neighbour search of an artifact (see neighbour_search.backends). Raises FileNotFoundError if the
+    model does not exist.
+    """
+    if path is None:
+        path = default_model_path()
+    if os.path.isdir(path):
+        from yield_cube import YieldCube, is_cube
+
+        if is_cube(path):
+            if backend not in (None, 'brute'):
+                raise ValueError("A yield cube has no neighbour search backend; select it for the model the cube falls back to")
+            return YieldCube(path)
+
+        from model_artifact import MappedKNNModel
+
+        return MappedKNNModel(path, backend=backend or 'brute')
+    if backend not in (None, 'brute'):
+        raise ValueError(f"The '{backend}' neighbour search backend needs an exported model artifact (see model_artifact.py)")
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model file '{path}' not found.")
+    if path.endswith('.h5'):
+        from keras_numpy import NetworkModel
+
+        return NetworkModel.from_h5(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def add_model_arguments(parser, backend=True):
+    """
+    Adds the --model option shared by the command line tools to an argparse parser and, unless backend
+    is False, --backend with the neighbour search backends of neighbour_search.backends.
+    """
+    from neighbour_search import backends
+
+    parser.add_argument("--model", default=None,
+                        help="pickled pipeline, exported artifact directory, yield cube directory or Keras .h5 "
+                             f"network (default: ${model_env_var}, else the artifact if exported, else the pickle)")
+    if backend:
+        parser.add_argument("--backend", choices=sorted(backends), default=None,
+                            help="neighbour search of an exported artifact: brute (default) and kdtree are exact, "
+                                 "rpforest is experimental and approximate (lossy)")
+
+
+def check_columns(columns):
+    """
+    Raises ValueError if any of the prediction features is missing from columns.
+    """
+    missing = [name for name in prediction_features if name not in columns]
+    if missing:
+        raise ValueError(f"Input is missing required column(s): {', '.join(missing)}")
+
+
+def trend_rows(row, horizon=trend_horizon):
+    """
+    Returns the prediction rows of a yield trend: row (a 7-tuple in prediction_features order) repeated
+    for each of the horizon years starting at its Crop_Year.
+    """
+    crop, crop_year, season, state, annual_rainfall, fertilizer, pesticide = row
+    return [(crop, year, season, state, annual_rainfall, fertilizer, pesticide)
+            for year in range(crop_year, crop_year + horizon)]
+
+
+def synthetic_frame(rows, seed=0):
+    """
+    Returns a DataFrame of random but plausible prediction inputs drawn from the dropdown vocabularies.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Crop': rng.choice(crop_options, rows),
+        'Crop_Year': rng.integers(1997, 2031, rows),
+        'Season': rng.choice(season_options, rows),
+        'State': rng.choice(state_options, rows),
+        'Annual_Rainfall': rng.uniform(300.0, 3500.0, rows),
+        'Fertilizer': rng.uniform(1e3, 1e8, rows),
+        'Pesticide': rng.uniform(1e1, 1e6, rows),
+    }, columns=prediction_features)